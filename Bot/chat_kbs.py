@@ -0,0 +1,82 @@
+"""
+Which knowledge base each chat answers from (/kb).
+
+One row per chat in a small SQLite table, read on every lookup. In webhook
+mode several forked workers share the file: each /kb writes only its own
+chat's row, so workers never overwrite each other's selections, and an
+inline query served by a different worker than the chat still sees it.
+
+Like the query cache, the connection is opened per process and the
+database runs in WAL mode.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_kbs (
+    chat_id TEXT PRIMARY KEY,
+    kb      TEXT NOT NULL
+);
+"""
+
+
+class ChatKBStore:
+    """chat id -> selected KB name (chats without a row use the default)."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Never reuse a connection inherited across fork()
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, chat_id, default: str) -> str:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT kb FROM chat_kbs WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+        return row[0] if row else default
+
+    def set(self, chat_id, name):
+        """Select KB `name` for a chat (None = back to the default)."""
+        with self._lock:
+            db = self._db()
+            with db:
+                if name is None:
+                    db.execute("DELETE FROM chat_kbs WHERE chat_id = ?", (str(chat_id),))
+                else:
+                    db.execute(
+                        "INSERT OR REPLACE INTO chat_kbs (chat_id, kb) VALUES (?, ?)",
+                        (str(chat_id), name),
+                    )
+
+    def import_json(self, json_path):
+        """
+        Take over the selections of an older chat_kbs.json and delete it.
+        Rows already in the table win.
+        """
+        try:
+            selection = json.loads(json_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return 0
+
+        with self._lock:
+            db = self._db()
+            with db:
+                db.executemany(
+                    "INSERT OR IGNORE INTO chat_kbs (chat_id, kb) VALUES (?, ?)",
+                    [(str(chat), name) for chat, name in selection.items()],
+                )
+        json_path.unlink(missing_ok=True)
+        return len(selection)
@@ -0,0 +1,151 @@
+"""
+Compact in-memory layout of a loaded knowledge base.
+
+meta.json entries are parsed once and then dropped: the bot only keeps
+what answering touches, stored column-wise:
+
+- ids and source-file names as interned strings, questions as a list;
+- rendered answers in one UTF-8 buffer with an offsets array;
+- tags as int32 ids into one shared tag table (with offsets per entry);
+  these small integer columns are array.array rather than numpy, since
+  indexing them yields plain ints without numpy's per-scalar overhead;
+- question embeddings as the (n, dim) matrix loaded from concepts.npy,
+  related entries as the (n, k) matrix from related.npy;
+- source paths only for the few entries that have any.
+
+Entry is a slotted (kb, row) view with the same item["key"] / item.get()
+access the rest of the bot uses on plain dicts, so decision.py, suggest.py,
+replies.py and source_files.py work on it unchanged. "answer" returns the
+rendered (whitespace-normalized) answer; notes, created_at and the raw
+answer text are not kept.
+"""
+
+from array import array
+from itertools import accumulate
+import sys
+
+import numpy as np
+
+from replies import render_answer
+
+
+class CompactKB:
+    """Column store of KB entries (see module docstring)."""
+
+    def __init__(self, items, concepts: np.ndarray, related: np.ndarray = None):
+        n = len(items)
+
+        self.ids = [sys.intern(item["id"]) for item in items]
+        self.questions = [item["question"] for item in items]
+        self.source_files = [
+            sys.intern(item["_source_file"]) if item.get("_source_file") else None
+            for item in items
+        ]
+
+        # Rendered answers: one buffer, entry i is answers[off[i]:off[i + 1]]
+        encoded = [render_answer(item["answer"]).encode("utf-8") for item in items]
+        self.answer_offsets = array("q", accumulate((len(b) for b in encoded), initial=0))
+        self.answers = b"".join(encoded)
+
+        # Tags: ids into tag_names, entry i is tag_ids[off[i]:off[i + 1]]
+        tag_table = {}
+        flat = []
+        offsets = [0]
+        for item in items:
+            for tag in item.get("tags", []):
+                flat.append(tag_table.setdefault(tag, len(tag_table)))
+            offsets.append(len(flat))
+        self.tag_names = list(tag_table)
+        self.tag_ids = array("i", flat)
+        self.tag_offsets = array("q", offsets)
+
+        # Most entries have no files attached: keep only those that do
+        self.sources = {
+            row: item["source"]
+            for row, item in enumerate(items)
+            if (item.get("source") or {}).get("path")
+        }
+
+        self.concepts = np.ascontiguousarray(concepts, dtype=np.float32)
+        self.related = related
+
+        self.entries = [Entry(self, row) for row in range(n)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    # -------------------------
+    # Column access
+    # -------------------------
+
+    def answer(self, row: int) -> str:
+        start, end = self.answer_offsets[row], self.answer_offsets[row + 1]
+        return self.answers[start:end].decode("utf-8")
+
+    def tags(self, row: int):
+        start, end = self.tag_offsets[row], self.tag_offsets[row + 1]
+        names = self.tag_names
+        return [names[t] for t in self.tag_ids[start:end]]
+
+    def related_entries(self, row: int):
+        if self.related is None:
+            return []
+        return [self.entries[r] for r in self.related[row].tolist() if r >= 0]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns."""
+        strings = sum(
+            sys.getsizeof(s)
+            for column in (self.ids, self.questions, self.tag_names)
+            for s in column
+        )
+        arrays = self.concepts.nbytes + sum(
+            a.itemsize * len(a)
+            for a in (self.answer_offsets, self.tag_ids, self.tag_offsets)
+        )
+        if self.related is not None:
+            arrays += self.related.nbytes
+        entries = len(self.entries) * sys.getsizeof(self.entries[0]) if self.entries else 0
+        return strings + arrays + len(self.answers) + entries
+
+
+_FIELDS = {
+    "id": lambda kb, row: kb.ids[row],
+    "question": lambda kb, row: kb.questions[row],
+    "answer": CompactKB.answer,
+    "_rendered": CompactKB.answer,
+    "tags": CompactKB.tags,
+    "source": lambda kb, row: kb.sources.get(row),
+    "_source_file": lambda kb, row: kb.source_files[row],
+    "_concept_embedding": lambda kb, row: kb.concepts[row],
+    "_related": CompactKB.related_entries,
+}
+
+
+class Entry:
+    """Read-only, dict-like view of one KB entry."""
+
+    __slots__ = ("kb", "row")
+
+    def __init__(self, kb: CompactKB, row: int):
+        self.kb = kb
+        self.row = row
+
+    def __getitem__(self, key):
+        try:
+            field = _FIELDS[key]
+        except KeyError:
+            raise KeyError(key) from None
+        return field(self.kb, self.row)
+
+    def get(self, key, default=None):
+        field = _FIELDS.get(key)
+        if field is None:
+            return default
+        return field(self.kb, self.row)
+
+    def __contains__(self, key):
+        return key in _FIELDS
+
+    def __repr__(self):
+        return f"Entry({self.kb.ids[self.row]!r})"
@@ -0,0 +1,151 @@
+"""
+Short per-chat memory for follow-up questions.
+
+After answering, the bot remembers for each chat what the last question
+was about (ChatContext): its embedding, the candidate rows the search
+returned (plus the answered entry's related rows) and the answered row.
+
+A message that reads like a follow-up ("and its time complexity?",
+"what about deletion?") is resolved against that context first:
+
+1. its embedding is blended with the previous one, so "its" carries the
+   earlier topic into the vector;
+2. only the cached candidate rows are re-scored against the blend
+   (a handful of dot products, no index search);
+3. if none of them is a good enough answer, the blended embedding goes
+   through the normal full search.
+
+Contexts are bounded: they expire after a TTL and the least recently
+updated chats are dropped beyond a maximum count. In webhook mode each
+worker keeps the contexts of the chats routed to it.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import re
+import threading
+import time
+
+import numpy as np
+
+from suggest import tokenize
+
+CONTEXT_TTL_SECONDS = 600
+MAX_CONTEXTS = 5000
+FOLLOW_UP_MAX_WORDS = 8
+ANAPHORA_WITHIN = 4         # "how does it work" yes, "what is a stack and how does it work" no
+QUERY_WEIGHT = 0.6          # share of the new message in the blended embedding
+
+# Openers that continue the previous question rather than start a new one
+FOLLOW_UP_OPENERS = re.compile(
+    r"^\s*(and what about|and how about|and|also|then|so|but|what about|how about|"
+    r"what if|same for|now)\b[\s,]*",
+    re.IGNORECASE,
+)
+
+# Words that refer back to something already mentioned
+ANAPHORA = frozenset("""
+it its it's this these those they them their same above previous former latter
+""".split())
+
+
+@dataclass
+class ChatContext:
+    kb: str                     # KB name
+    version: str                # KB version the rows belong to
+    embedding: np.ndarray       # normalized embedding of the last question
+    rows: tuple                 # candidate rows to re-score on a follow-up
+    answered: int               # row of the entry that was answered
+    updated: float
+
+
+def is_follow_up(query: str) -> bool:
+    """Short message that opens with a continuation or refers back."""
+    words = tokenize(query)
+    if not words or len(words) > FOLLOW_UP_MAX_WORDS:
+        return False
+    if FOLLOW_UP_OPENERS.match(query):
+        return True
+    return any(w in ANAPHORA for w in words[:ANAPHORA_WITHIN])
+
+
+def strip_opener(query: str) -> str:
+    """"and what about heaps?" -> "heaps?" (for the combo-query check)."""
+    return FOLLOW_UP_OPENERS.sub("", query, count=1)
+
+
+def blend(query_embedding: np.ndarray, context_embedding: np.ndarray,
+          weight: float = QUERY_WEIGHT) -> np.ndarray:
+    """Normalized weighted mix of the new and the previous embedding."""
+    mixed = weight * query_embedding + (1 - weight) * context_embedding
+    norm = np.linalg.norm(mixed)
+    return (mixed / norm if norm else query_embedding).astype(np.float32)
+
+
+def rescore(index, rows, embedding: np.ndarray):
+    """
+    Inner-product scores of the given index rows against an embedding,
+    from the stored vectors (same scores a search would return).
+    Returns (scores, rows) strongest-first.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    vectors = index.reconstruct_batch(rows)
+    scores = vectors @ embedding
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+class ConversationStore:
+    """ChatContext per chat id, with TTL expiry and an LRU size cap."""
+
+    def __init__(self, ttl: float = CONTEXT_TTL_SECONDS,
+                 max_contexts: int = MAX_CONTEXTS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_contexts = max_contexts
+        self.clock = clock
+
+        self._contexts = OrderedDict()      # chat id -> ChatContext, oldest first
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, kb=None):
+        """
+        Live context of a chat, or None. With kb (a LoadedKB) given, a
+        context from another KB or an older version of it also counts as none.
+        """
+        with self._lock:
+            context = self._contexts.get(chat_id)
+            if context is None:
+                return None
+            if self.clock() - context.updated > self.ttl:
+                del self._contexts[chat_id]
+                return None
+        if kb is not None and (context.kb, context.version) != (kb.name, kb.version):
+            return None
+        return context
+
+    def remember(self, chat_id, kb, embedding, rows, answered: int):
+        """Store what a chat was just answered (kb is a LoadedKB)."""
+        now = self.clock()
+        context = ChatContext(
+            kb=kb.name,
+            version=kb.version,
+            embedding=np.asarray(embedding, dtype=np.float32),
+            rows=tuple(int(r) for r in rows),
+            answered=int(answered),
+            updated=now,
+        )
+        with self._lock:
+            self._contexts[chat_id] = context
+            self._contexts.move_to_end(chat_id)
+            self._expire(now)
+
+    def _expire(self, now):
+        # Oldest first, so stop at the first live context
+        while self._contexts:
+            oldest = next(iter(self._contexts.values()))
+            if now - oldest.updated <= self.ttl and len(self._contexts) <= self.max_contexts:
+                break
+            self._contexts.popitem(last=False)
+
+    def __len__(self):
+        return len(self._contexts)
@@ -0,0 +1,111 @@
+"""
+Per-query latency budget and the metrics that show how often it bites.
+
+A Deadline starts when the bot begins handling a message. Each expensive
+phase gets a share of what is left, and the handler takes a cheaper path
+when a phase would not fit:
+
+- encoding too slow    -> answer from the lexical index (or say "busy")
+- no time left to search -> same
+- little time left       -> answer with the top result instead of a merge,
+                            and skip reranking
+
+Everything before the first reply message is bounded this way; sending the
+reply itself is network time and is not.
+
+QueryMetrics counts outcomes and degradations and keeps recent latencies
+for the admin /metrics command, plus recent timings of stages that run
+off the event loop (the encode worker). Each webhook worker keeps its own.
+"""
+
+from collections import Counter, deque
+import time
+
+LATENCY_WINDOW = 1000       # recent queries kept for percentiles
+
+
+class Deadline:
+    """Time budget of one query, in seconds."""
+
+    def __init__(self, budget: float, clock=time.perf_counter):
+        self.budget = budget
+        self.clock = clock
+        self.started = clock()
+        self.degraded = []      # reasons, in the order they happened
+        self.outcome = None     # set by the handler: "answered", "declined", …
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget - self.elapsed())
+
+    def share(self, fraction: float) -> float:
+        """Up to fraction of the whole budget, but no more than is left."""
+        return min(self.remaining(), self.budget * fraction)
+
+    def degrade(self, reason: str):
+        self.degraded.append(reason)
+
+
+class QueryMetrics:
+    """Outcome / degradation counters and a window of recent latencies."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.outcomes = Counter()
+        self.degradations = Counter()
+        self.over_budget = 0
+        self.latencies = deque(maxlen=window)
+        self.spans = {}         # stage name -> deque of recent timings
+        self.window = window
+        self.since = time.time()
+
+    def record(self, deadline: Deadline):
+        elapsed = deadline.elapsed()
+        self.outcomes[deadline.outcome or "dropped"] += 1
+        self.degradations.update(deadline.degraded)
+        self.latencies.append(elapsed)
+        if elapsed > deadline.budget:
+            self.over_budget += 1
+
+    def record_span(self, name: str, seconds: float):
+        """Time one run of a stage that is not part of the handler's own timing."""
+        self.spans.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, p: float, values=None) -> float:
+        values = self.latencies if values is None else values
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def report(self) -> str:
+        total = sum(self.outcomes.values())
+        minutes = (time.time() - self.since) / 60
+        lines = [f"📈 {total} queries in the last {minutes:.0f} min"]
+
+        if total:
+            lines.append(
+                "Latency (ms): "
+                f"p50 {1000 * self.percentile(50):.0f} · "
+                f"p90 {1000 * self.percentile(90):.0f} · "
+                f"p99 {1000 * self.percentile(99):.0f} · "
+                f"max {1000 * max(self.latencies):.0f}"
+            )
+            lines.append(f"Over budget: {self.over_budget}")
+            lines.append("Outcomes: " + ", ".join(
+                f"{name} {count}" for name, count in self.outcomes.most_common()
+            ))
+            if self.degradations:
+                lines.append("Degraded: " + ", ".join(
+                    f"{name} {count}" for name, count in self.degradations.most_common()
+                ))
+
+        for name, values in self.spans.items():
+            lines.append(
+                f"{name.capitalize()} (ms, last {len(values)}): "
+                f"p50 {1000 * self.percentile(50, values):.0f} · "
+                f"p90 {1000 * self.percentile(90, values):.0f} · "
+                f"max {1000 * max(values):.0f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,210 @@
+"""
+Answer decision logic for the Telegram bot.
+
+Everything in this module is pure: it takes similarity scores, candidate
+KB entries and a query embedding, and decides whether the bot should
+decline, answer with a single entry, or merge several entries.
+
+Keeping it free of model / index / Telegram state lets the same code be
+used by the bot at query time and by tune_thresholds.py offline.
+"""
+
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+
+# ============================================================
+# Decision constants (hand-picked; see tune_thresholds.py)
+# ============================================================
+
+MIN_MERGE_SCORE = 0.55
+
+CONFIDENCE_LEVELS = (
+    (0.70, "high"),
+    (0.60, "medium"),
+    (0.50, "low"),
+)
+
+COMBO_KEYWORDS = (
+    "and", "vs", "versus", "difference", "compare",
+    "comparison", "between"
+)
+
+# Dominance threshold:
+# If the top result is this much better than the second-best,
+# we assume a single clear answer and avoid merging.
+DOMINANCE_MARGIN = 0.12
+
+MIN_COMMON_TAGS = 2
+
+CONCEPT_SIM_THRESHOLD = 0.60  # tunable
+
+# Second stage (cross-encoder relevance, 0-1; see rerank.py):
+# entries below RERANK_MIN_SCORE are dropped from an ambiguous result,
+# and one that leads the next by RERANK_MARGIN is answered alone.
+RERANK_MIN_SCORE = 0.1
+RERANK_MARGIN = 0.3
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    """One full set of decision thresholds."""
+    min_merge_score: float = MIN_MERGE_SCORE
+    confidence_levels: tuple = CONFIDENCE_LEVELS
+    dominance_margin: float = DOMINANCE_MARGIN
+    concept_sim_threshold: float = CONCEPT_SIM_THRESHOLD
+    min_common_tags: int = MIN_COMMON_TAGS
+
+
+DEFAULT_THRESHOLDS = Thresholds()
+
+
+class Decision(NamedTuple):
+    """
+    Outcome of decide():
+    - kind: "none", "single" or "merge"
+    - results: [(score, item), ...] strongest-first (empty for "none")
+    - confidence: confidence label of the best surviving result
+    """
+    kind: str
+    results: list
+    confidence: str
+
+
+# -------------------------
+# Similarity & confidence
+# -------------------------
+
+def confidence_from_score(score: float, levels=CONFIDENCE_LEVELS) -> str:
+    """Map cosine similarity score to a confidence label."""
+    for threshold, level in levels:
+        if score >= threshold:
+            return level
+    return "none"
+
+
+def is_dominant(
+    best_score: float,
+    second_score: float,
+    margin: float = DOMINANCE_MARGIN
+) -> bool:
+    """
+    Determine whether the top result clearly dominates the second-best.
+    """
+    return (best_score - second_score) >= margin
+
+
+def tag_overlap_count(tags_a, tags_b) -> int:
+    """Return number of common tags between two tag lists."""
+    return len(set(tags_a) & set(tags_b))
+
+
+def is_concept_demanded_semantic(
+    query_embedding: np.ndarray,
+    item_embedding: np.ndarray,
+    threshold: float = CONCEPT_SIM_THRESHOLD
+) -> bool:
+    """Check whether the query semantically demands this concept."""
+    similarity = float(np.dot(query_embedding, item_embedding))
+    return similarity >= threshold
+
+
+def is_combo_query(query: str) -> bool:
+    """Detect whether the query likely demands multiple concepts."""
+    q = query.lower()
+    return any(k in q for k in COMBO_KEYWORDS)
+
+
+# -------------------------
+# Decision
+# -------------------------
+
+def decide(
+    candidates,
+    query_embedding: np.ndarray,
+    combo_query: bool,
+    thresholds: Thresholds = DEFAULT_THRESHOLDS
+) -> Decision:
+    """
+    Decide how to answer from semantic search candidates.
+
+    candidates: [(score, item), ...] as returned by the index search.
+    Items must carry "_concept_embedding" (normalized question embedding).
+    """
+    # Filter out weak semantic matches, strongest-first
+    relevant = [
+        (s, it) for s, it in candidates
+        if s >= thresholds.min_merge_score
+    ]
+    if not relevant:
+        return Decision("none", [], "none")
+
+    relevant.sort(key=lambda x: x[0], reverse=True)
+
+    # Enforce conceptual and tag coherence
+    top_tags = relevant[0][1].get("tags", [])
+    filtered = []
+
+    for score, item in relevant:
+        concept_match = is_concept_demanded_semantic(
+            query_embedding,
+            item["_concept_embedding"],
+            thresholds.concept_sim_threshold
+        )
+        common_tags = tag_overlap_count(top_tags, item.get("tags", []))
+
+        if (
+            concept_match
+            or combo_query
+            or common_tags >= thresholds.min_common_tags
+        ):
+            filtered.append((score, item))
+
+    if not filtered:
+        return Decision("none", [], "none")
+
+    # Confidence and dominance assessment
+    best_score = filtered[0][0]
+    second_score = filtered[1][0] if len(filtered) > 1 else 0.0
+    confidence = confidence_from_score(
+        best_score, thresholds.confidence_levels
+    )
+
+    if len(filtered) == 1 or is_dominant(
+        best_score, second_score, thresholds.dominance_margin
+    ):
+        return Decision("single", filtered[:1], confidence)
+
+    return Decision("merge", filtered, confidence)
+
+
+def rerank_decision(
+    decision: Decision,
+    rerank_scores,
+    min_score: float = RERANK_MIN_SCORE,
+    margin: float = RERANK_MARGIN,
+    levels=CONFIDENCE_LEVELS
+) -> Decision:
+    """
+    Re-decide an ambiguous ("merge") decision from second-stage scores,
+    one per entry of decision.results.
+
+    The first-stage decision is kept if the reranker finds none of the
+    entries relevant (it then adds no information).
+    """
+    ranked = sorted(
+        zip(rerank_scores, decision.results),
+        key=lambda x: x[0],
+        reverse=True
+    )
+    kept = [(r, result) for r, result in ranked if r >= min_score]
+    if not kept:
+        return decision
+
+    results = [result for _, result in kept]
+    if len(kept) == 1 or is_dominant(kept[0][0], kept[1][0], margin):
+        best = results[0]
+        return Decision("single", [best], confidence_from_score(best[0], levels))
+
+    return Decision("merge", results, decision.confidence)
@@ -0,0 +1,112 @@
+"""
+Cheap checks that run before a query reaches the embedding model.
+
+- query_gate(): rejects input that cannot be answered (no real words,
+  character floods, nothing in common with the KB vocabulary) using only
+  string operations and set lookups.
+- RateLimiter: token buckets per user / chat with a burst size and a
+  steady refill rate, so floods are dropped before any encode.
+"""
+
+from typing import NamedTuple
+import re
+import time
+
+from suggest import STOPWORDS, tokenize
+
+MIN_QUERY_LENGTH = 4
+MAX_QUERY_LENGTH = 1000
+MAX_REPEATED_CHARS = 6          # "aaaaaaa", "!!!!!!!!" …
+
+_REPEAT_RE = re.compile(r"(.)\1{%d,}" % MAX_REPEATED_CHARS)
+
+
+# =========================================================
+# Lexical gate
+# =========================================================
+
+def build_vocabulary(items) -> frozenset:
+    """Every word of every question, answer and tag of a KB."""
+    words = set()
+    for item in items:
+        words.update(tokenize(item.get("question", "")))
+        words.update(tokenize(item.get("answer", "")))
+        for tag in item.get("tags", []):
+            words.update(tokenize(tag))
+    return frozenset(words)
+
+
+def query_gate(query: str, vocabulary, fuzzy_words=None):
+    """
+    Return None if the query deserves a semantic search, else why not:
+
+    - "invalid":   too short/long, no words, or a character flood
+    - "unknown":   none of its content words occur in the KB
+                   (also not as a close misspelling, if fuzzy_words is given)
+    """
+    if not MIN_QUERY_LENGTH <= len(query) <= MAX_QUERY_LENGTH:
+        return "invalid"
+    if _REPEAT_RE.search(query):
+        return "invalid"
+
+    words = [w for w in tokenize(query) if len(w) > 1]
+    if not words:
+        return "invalid"
+
+    content = [w for w in words if w not in STOPWORDS] or words
+    if any(w in vocabulary for w in content):
+        return None
+    if fuzzy_words and any(fuzzy_words(w) for w in content):
+        return None
+    return "unknown"
+
+
+# =========================================================
+# Rate limiting
+# =========================================================
+
+class Verdict(NamedTuple):
+    allowed: bool
+    retry_after: float      # seconds until the next token (0 if allowed)
+    notify: bool            # first refusal since the last allowed request
+
+
+class RateLimiter:
+    """
+    Token bucket per key: up to `burst` requests at once, refilled at
+    `per_minute` tokens per minute.
+    """
+
+    # Forget idle (full) buckets once this many keys are tracked
+    MAX_TRACKED = 10_000
+
+    def __init__(self, burst: int, per_minute: float, clock=time.monotonic):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.clock = clock
+        self._buckets = {}      # key -> [tokens, updated_at, notified]
+
+    def acquire(self, key) -> Verdict:
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_TRACKED:
+                self._forget_idle(now)
+            bucket = self._buckets[key] = [float(self.burst), now, False]
+
+        tokens, updated, notified = bucket
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        if tokens >= 1:
+            bucket[:] = [tokens - 1, now, False]
+            return Verdict(True, 0.0, False)
+
+        bucket[:] = [tokens, now, True]
+        return Verdict(False, (1 - tokens) / self.rate, not notified)
+
+    def _forget_idle(self, now):
+        refill = self.burst / self.rate
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < refill
+        }
@@ -0,0 +1,133 @@
+"""
+Several named knowledge bases served from one bot process.
+
+Each KB is its own published index (index_store.kb_root()). They share
+the bot's single embedding model; only their indexes and metadata are
+held per KB:
+
+- a KB is loaded on first use (or when its live version changes);
+- loaded KBs are kept in LRU order and the least recently used ones are
+  dropped once their estimated footprint exceeds the memory budget.
+
+The KB being requested is never evicted, so a single KB larger than the
+budget still works. Handlers keep a reference to the LoadedKB they
+started with, so an eviction never pulls data out from under a reply.
+
+Loading (FAISS index + metadata) happens outside the pool lock, one load
+per KB at a time; the lock only guards the LRU bookkeeping. Handlers use
+get_async(), which runs a (re)load in the default executor so the event
+loop keeps serving other chats meanwhile.
+"""
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+
+
+@dataclass
+class LoadedKB:
+    name: str
+    manifest: dict
+    index: object           # faiss index
+    items: list             # KB entries, in index row order
+    by_id: dict             # entry id -> entry
+    suggestions: object     # SuggestionIndex
+    vocabulary: frozenset   # every word of the KB (pre-encode gate)
+    footprint: int          # estimated bytes held in memory
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+
+def estimate_footprint(manifest: dict, held_bytes: int = 0) -> int:
+    """
+    Rough in-memory size of a loaded KB: its index file plus the bytes
+    held by its entries (CompactKB.nbytes()).
+    """
+    index_path = manifest["_paths"].get("index")
+    return held_bytes + (index_path.stat().st_size if index_path else 0)
+
+
+class KBPool:
+    """
+    LRU of loaded knowledge bases under a memory budget.
+
+    load(name) -> LoadedKB builds a KB from its live version;
+    live_version(name) -> str|None reads its CURRENT pointer (cheap).
+    """
+
+    def __init__(self, load, live_version, budget_bytes: int):
+        self._load = load
+        self._live_version = live_version
+        self.budget_bytes = budget_bytes
+
+        self._loaded = OrderedDict()     # name -> LoadedKB
+        self._loading = {}               # name -> lock held while loading it
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> LoadedKB:
+        """Return KB `name`, loading or reloading it if needed (blocking)."""
+        kb = self._current(name)
+        if kb is None:
+            with self._loading_lock(name):
+                # Another thread may have finished the same load meanwhile
+                kb = self._current(name)
+                if kb is None:
+                    kb = self._load(name)
+                    with self._lock:
+                        self._loaded[name] = kb
+
+        self._touch(name)
+        return kb
+
+    async def get_async(self, name: str) -> LoadedKB:
+        """
+        get() for the event loop: a loaded, current KB is returned directly;
+        a (re)load runs in the default executor.
+        """
+        kb = self._current(name)
+        if kb is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.get, name)
+
+        self._touch(name)
+        return kb
+
+    def _current(self, name: str):
+        """The loaded KB `name` if its live version is still the loaded one."""
+        with self._lock:
+            kb = self._loaded.get(name)
+        if kb is None:
+            return None
+
+        live = self._live_version(name)
+        if live is not None and live != kb.version:
+            return None
+        return kb
+
+    def _loading_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._loading.setdefault(name, threading.Lock())
+
+    def _touch(self, name: str):
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                self._evict(keep=name)
+
+    def _evict(self, keep: str):
+        while self.used_bytes() > self.budget_bytes and len(self._loaded) > 1:
+            oldest = next(iter(self._loaded))
+            if oldest == keep:
+                break
+            del self._loaded[oldest]
+
+    def used_bytes(self) -> int:
+        return sum(kb.footprint for kb in self._loaded.values())
+
+    def loaded(self):
+        """Names of loaded KBs, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
@@ -0,0 +1,527 @@
+"""
+End-to-end load test of the Telegram bot against a local Bot API stand-in.
+
+FakeBotAPI implements the Bot API methods the bot uses (getMe,
+getUpdates long polling, sendMessage, editMessageReplyMarkup,
+answerCallbackQuery, sendDocument, …) on a local HTTP port. The bot is
+started unchanged with TELEGRAM_API_BASE_URL pointing at it, so its
+handlers, model and index run exactly as in production, with no network.
+
+Virtual users then send synthetic updates at a configurable rate and
+concurrency:
+
+- questions taken from the live KB (the reply must contain that entry's
+  answer), optionally mixed with noise text (must be turned away);
+- "Related" and "Get Source Files" button clicks (callback queries).
+
+Each user waits for the complete reply before sending its next update,
+and the run reports throughput, first-chunk and full-reply latency
+percentiles and content checks.
+
+Usage (from the repository root):
+
+    python Bot/load_test.py --requests 500 --concurrency 8 --rate 20
+
+    # webhook mode: start Bot/webhook_server.py with
+    # TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot, then
+    python Bot/load_test.py --no-launch --webhook http://127.0.0.1:8443/webhook
+"""
+
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from replies import render_answer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import index_store  # noqa: E402
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+API_HOST = "127.0.0.1"
+API_PORT = 8081
+TOKEN = "123456:LOADTEST"
+
+READY_TIMEOUT = 300           # seconds to wait for the bot to start polling
+REPLY_TIMEOUT = 30            # seconds before a request counts as timed out
+SETTLE_SECONDS = 0.05         # quiet time after the last chunk of a reply
+SNIPPET_LENGTH = 40           # answer prefix a reply must contain
+
+# Methods that deliver something visible to a chat
+REPLY_METHODS = {
+    "sendMessage", "sendDocument", "editMessageReplyMarkup",
+    "editMessageText", "answerCallbackQuery",
+}
+
+NOISE = ("asdf qwer zxcv", "🙂🙂🙂🙂", "hahahahahahahaha", "lorem ipsum dolor sit")
+
+
+# ============================================================
+# Fake Bot API
+# ============================================================
+
+class FakeBotAPI:
+    """Threaded HTTP stand-in for api.telegram.org."""
+
+    def __init__(self, host: str = API_HOST, port: int = API_PORT, webhook: str = None):
+        self.webhook = webhook
+        self.polled = threading.Event()         # bot reached getUpdates
+
+        self._updates = []
+        self._cond = threading.Condition()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._callback_chats = {}               # callback query id -> chat id
+        self._listener = None
+
+        self.calls = {}                         # method -> count
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def on_reply(self, listener):
+        """listener(chat_id, method, text, timestamp) for every reply call."""
+        self._listener = listener
+
+    # -------------------------
+    # Updates (bot-bound)
+    # -------------------------
+
+    def inject(self, update: dict):
+        with self._cond:
+            update["update_id"] = self._next_update_id
+            self._next_update_id += 1
+            callback = update.get("callback_query")
+            if callback:
+                self._callback_chats[callback["id"]] = callback["message"]["chat"]["id"]
+
+            if not self.webhook:
+                self._updates.append(update)
+                self._cond.notify_all()
+                return
+
+        request = urllib.request.Request(
+            self.webhook,
+            data=json.dumps(update).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request, timeout=10).close()
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), 10)
+        self.polled.set()
+
+        with self._cond:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout:
+                self._cond.wait(timeout)
+            return list(self._updates)
+
+    # -------------------------
+    # Replies (bot-sent)
+    # -------------------------
+
+    def _message(self, chat_id, text=None):
+        with self._cond:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def _call(self, method: str, params: dict):
+        now = time.perf_counter()
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getMe":
+            return {
+                "id": int(TOKEN.split(":")[0]), "is_bot": True,
+                "first_name": "KB", "username": "kb_loadtest_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False,
+                "supports_inline_queries": True,
+            }
+        if method == "getUpdates":
+            return self._get_updates(params)
+
+        chat_id = params.get("chat_id")
+        if method == "answerCallbackQuery":
+            chat_id = self._callback_chats.pop(params.get("callback_query_id"), None)
+        chat_id = int(chat_id) if chat_id not in (None, "") else None
+
+        if method in REPLY_METHODS and self._listener and chat_id is not None:
+            text = params.get("text") or params.get("caption") or ""
+            self._listener(chat_id, method, text, now)
+
+        if method in ("sendMessage", "sendDocument", "editMessageText"):
+            return self._message(chat_id, params.get("text"))
+        if method == "editMessageReplyMarkup":
+            return self._message(chat_id)
+        return True
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                method = self.path.rsplit("/", 1)[-1]
+                try:
+                    result = api._call(method, parse_params(self.headers, body))
+                    payload = {"ok": True, "result": result}
+                except Exception as e:  # report, don't kill the server thread
+                    payload = {"ok": False, "error_code": 400, "description": str(e)}
+
+                out = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def parse_params(headers, body: bytes) -> dict:
+    """Bot API parameters from a JSON, form-encoded or multipart body."""
+    content_type = headers.get("Content-Type", "")
+    if not body:
+        return {}
+    if "json" in content_type:
+        return json.loads(body)
+    if "multipart/form-data" in content_type:
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            if part.get_filename() is None:
+                params[part.get_param("name", header="content-disposition")] = (
+                    part.get_content()
+                )
+        return params
+    return dict(parse_qsl(body.decode("utf-8")))
+
+
+# ============================================================
+# Synthetic traffic
+# ============================================================
+
+def build_probes(noise: float, callbacks: float, seed: int):
+    """
+    Endless generator of (kind, payload, check) from the live KB.
+    check(texts, methods) -> bool verifies the complete reply.
+    """
+    manifest = index_store.load_manifest()
+    kb = json.loads(manifest["_paths"]["meta"].read_text(encoding="utf-8"))
+    rng = random.Random(seed)
+
+    def contains(snippet):
+        return lambda texts, methods: any(snippet in t for t in texts)
+
+    def turned_away(texts, methods):
+        return bool(texts) and texts[0][:1] in ("😕", "😅")
+
+    while True:
+        item = rng.choice(kb)
+        roll = rng.random()
+
+        if roll < noise:
+            yield "noise", rng.choice(NOISE), turned_away
+        elif roll < noise + callbacks / 2:
+            yield "callback", f"rel:{item['id']}", contains(item["question"])
+        elif roll < noise + callbacks:
+            yield "callback", f"src:{item['id']}", (
+                lambda texts, methods: "editMessageReplyMarkup" in methods
+            )
+        else:
+            snippet = render_answer(item["answer"])[:SNIPPET_LENGTH]
+            yield "question", item["question"], contains(snippet)
+
+
+def make_update(kind: str, payload: str, chat_id: int) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+    chat = {"id": chat_id, "type": "private"}
+    now = int(time.time())
+
+    if kind == "callback":
+        return {
+            "callback_query": {
+                "id": f"{chat_id}-{time.perf_counter_ns()}",
+                "from": user,
+                "chat_instance": str(chat_id),
+                "data": payload,
+                "message": {"message_id": 1, "date": now, "chat": chat, "text": "…"},
+            }
+        }
+    return {
+        "message": {
+            "message_id": 1, "date": now, "chat": chat, "from": user,
+            "text": payload,
+        }
+    }
+
+
+class Pacer:
+    """Spaces request starts to at most `rate` per second across users."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            slot = max(self._next, time.perf_counter())
+            self._next = slot + self.interval
+        delay = slot - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# ============================================================
+# Load test
+# ============================================================
+
+class LoadTest:
+    def __init__(self, api: FakeBotAPI, args):
+        self.api = api
+        self.args = args
+        self.pacer = Pacer(args.rate)
+
+        self._probes = build_probes(args.noise, args.callbacks, args.seed)
+        self._probe_lock = threading.Lock()
+        self._remaining = args.requests
+
+        self._inbox = {}            # chat id -> [(method, text, t)]
+        self._inbox_cond = threading.Condition()
+        self.results = []           # dicts, one per request
+        self._results_lock = threading.Lock()
+
+        api.on_reply(self._record)
+
+    def _record(self, chat_id, method, text, t):
+        with self._inbox_cond:
+            self._inbox.setdefault(chat_id, []).append((method, text, t))
+            self._inbox_cond.notify_all()
+
+    def _next_probe(self):
+        with self._probe_lock:
+            if self._remaining <= 0:
+                return None
+            self._remaining -= 1
+            return next(self._probes)
+
+    def _await_reply(self, chat_id, deadline):
+        """Wait for a reply, then until the chat has been quiet for SETTLE_SECONDS."""
+        with self._inbox_cond:
+            while not self._inbox.get(chat_id):
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return []
+                self._inbox_cond.wait(left)
+
+            while True:
+                last = self._inbox[chat_id][-1][2]
+                quiet = last + SETTLE_SECONDS - time.perf_counter()
+                if quiet <= 0:
+                    return self._inbox.pop(chat_id)
+                self._inbox_cond.wait(quiet)
+
+    def _user(self, chat_id):
+        while True:
+            probe = self._next_probe()
+            if probe is None:
+                return
+            kind, payload, check = probe
+
+            self.pacer.wait()
+            started = time.perf_counter()
+            try:
+                self.api.inject(make_update(kind, payload, chat_id))
+            except OSError:
+                replies = []
+            else:
+                replies = self._await_reply(chat_id, started + REPLY_TIMEOUT)
+
+            texts = [text for method, text, _ in replies if text]
+            methods = {method for method, _, _ in replies}
+            result = {
+                "kind": kind,
+                "ok": bool(replies) and check(texts, methods),
+                "timeout": not replies,
+                "rate_limited": any(t.startswith("⏳") for t in texts),
+                "first": replies[0][2] - started if replies else None,
+                "full": replies[-1][2] - started if replies else None,
+            }
+            with self._results_lock:
+                self.results.append(result)
+
+    def run(self):
+        users = [
+            threading.Thread(target=self._user, args=(1000 + i,), daemon=True)
+            for i in range(self.args.concurrency)
+        ]
+        started = time.perf_counter()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        return time.perf_counter() - started
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def report(results, elapsed, calls):
+    lines = []
+    done = [r for r in results if not r["timeout"]]
+    lines.append(
+        f"Requests: {len(results)} in {elapsed:.1f}s → "
+        f"{len(done) / max(elapsed, 1e-9):.1f} replies/s"
+    )
+
+    for label, key in (("first chunk", "first"), ("full reply", "full")):
+        values = [1000 * r[key] for r in done]
+        lines.append(
+            f"Latency {label:<11} ms: p50 {percentile(values, 50):.0f}  "
+            f"p90 {percentile(values, 90):.0f}  p99 {percentile(values, 99):.0f}  "
+            f"max {max(values, default=float('nan')):.0f}"
+        )
+
+    for kind in ("question", "noise", "callback"):
+        subset = [r for r in results if r["kind"] == kind]
+        if subset:
+            ok = sum(r["ok"] for r in subset)
+            lines.append(f"  {kind:<9} {ok}/{len(subset)} verified")
+
+    timeouts = sum(r["timeout"] for r in results)
+    limited = sum(r["rate_limited"] for r in results)
+    lines.append(f"Timeouts: {timeouts}   Rate limited: {limited}")
+    lines.append("API calls: " + ", ".join(f"{m}={n}" for m, n in sorted(calls.items())))
+    return "\n".join(lines)
+
+
+# ============================================================
+# Entrypoint
+# ============================================================
+
+def launch_bot(api: FakeBotAPI, keep_rate_limits: bool):
+    env = dict(os.environ)
+    env["TELEGRAM_BOT_TOKEN"] = TOKEN
+    env["TELEGRAM_API_BASE_URL"] = api.base_url
+    if not keep_rate_limits:
+        # Virtual users are far chattier than people
+        for name in ("USER", "CHAT"):
+            env[f"BOT_{name}_RATE_BURST"] = "1000000"
+            env[f"BOT_{name}_RATE_PER_MINUTE"] = "1000000"
+
+    return subprocess.Popen(
+        [sys.executable, str(ROOT_DIR / "Bot" / "telegram_bot.py")],
+        cwd=ROOT_DIR,
+        env=env,
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test the bot against a fake Bot API")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="total updates to send")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="virtual users (chats) sending in parallel")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="max updates per second overall (0 = unpaced)")
+    parser.add_argument("--noise", type=float, default=0.1,
+                        help="share of noise messages")
+    parser.add_argument("--callbacks", type=float, default=0.2,
+                        help="share of button clicks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=API_PORT,
+                        help="port of the fake Bot API")
+    parser.add_argument("--no-launch", action="store_true",
+                        help="don't start the bot (it is already pointed at the fake API)")
+    parser.add_argument("--webhook", default=None,
+                        help="POST updates to this webhook URL instead of getUpdates")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="keep the bot's per-user rate limits when launching it")
+    parser.add_argument("--json", type=Path, default=None,
+                        help="also write raw results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    api = FakeBotAPI(API_HOST, args.port, webhook=args.webhook)
+    api.start()
+    print(f"Fake Bot API on {api.base_url}")
+
+    bot = None if args.no_launch else launch_bot(api, args.keep_rate_limits)
+    try:
+        if not args.webhook:
+            print("Waiting for the bot to start polling…")
+            if not api.polled.wait(READY_TIMEOUT):
+                raise SystemExit("❌ The bot never called getUpdates")
+
+        test = LoadTest(api, args)
+        elapsed = test.run()
+        print(report(test.results, elapsed, api.calls))
+
+        if args.json:
+            args.json.write_text(json.dumps({
+                "args": vars(args) | {"json": str(args.json)},
+                "elapsed_s": elapsed,
+                "results": test.results,
+            }, indent=2), encoding="utf-8")
+    finally:
+        if bot:
+            bot.send_signal(signal.SIGINT)
+            try:
+                bot.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
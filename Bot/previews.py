@@ -0,0 +1,214 @@
+"""
+Lightweight previews of source files, so users can check a note before
+downloading all of it.
+
+- PDF:        first page as an image (PyMuPDF), or its text (pypdf)
+- DOCX:       opening text, read straight from word/document.xml
+- MD / TXT:   opening text
+
+Both PDF libraries are optional; without either, PDFs simply get no
+preview button.
+
+Previews are cached under Data/previews/ by the file's content hash
+(source_files.file_digest, recomputed only when size or mtime changes), so
+an edited note gets a fresh preview and an unchanged one is never rendered
+twice, even across restarts and webhook workers. Rendering runs in a
+background thread pool; the bot starts it when it shows the file buttons,
+so the preview is usually ready by the time it is clicked.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+from xml.etree import ElementTree
+import asyncio
+import os
+import sys
+import threading
+import zipfile
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from source_files import file_digest  # noqa: E402
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+PREVIEW_DIR = Path("./Data") / "previews"
+MAX_CACHED_PREVIEWS = 500
+PREVIEW_WORKERS = 2
+
+SNIPPET_CHARS = 800
+PAGE_ZOOM = 1.5             # 72 dpi * 1.5: readable, ~100-200 KB per page
+
+TEXT_SUFFIXES = {".md", ".txt"}
+DOCX_TEXT = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t"
+DOCX_PARAGRAPH = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p"
+
+
+class Preview(NamedTuple):
+    kind: str       # "image" or "text"
+    path: Path      # cached PNG, or UTF-8 text file
+
+    def text(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+
+def can_preview(file_path: Path) -> bool:
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        return fitz is not None or PdfReader is not None
+    return suffix in TEXT_SUFFIXES or suffix == ".docx"
+
+
+# =========================================================
+# Renderers (file -> image bytes or text)
+# =========================================================
+
+def _snippet(text: str) -> str:
+    text = "\n".join(line.rstrip() for line in text.strip().splitlines())
+    if len(text) <= SNIPPET_CHARS:
+        return text
+    return text[:SNIPPET_CHARS].rsplit(" ", 1)[0] + " …"
+
+
+def _pdf_page_image(file_path: Path) -> bytes:
+    with fitz.open(file_path) as doc:
+        page = doc.load_page(0)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(PAGE_ZOOM, PAGE_ZOOM))
+        return pixmap.tobytes("png")
+
+
+def _pdf_text(file_path: Path) -> str:
+    reader = PdfReader(file_path)
+    return reader.pages[0].extract_text() if reader.pages else ""
+
+
+def _docx_text(file_path: Path) -> str:
+    # Stop once there is enough text; documents can be large
+    paragraphs = []
+    size = 0
+    with zipfile.ZipFile(file_path) as zf, zf.open("word/document.xml") as xml:
+        for _, element in ElementTree.iterparse(xml):
+            if element.tag != DOCX_PARAGRAPH:
+                continue
+            text = "".join(t.text or "" for t in element.iter(DOCX_TEXT))
+            element.clear()
+            if text:
+                paragraphs.append(text)
+                size += len(text)
+                if size > SNIPPET_CHARS:
+                    break
+    return "\n".join(paragraphs)
+
+
+def _plain_text(file_path: Path) -> str:
+    with file_path.open(encoding="utf-8", errors="replace") as f:
+        return f.read(SNIPPET_CHARS * 2)
+
+
+def render(file_path: Path):
+    """(kind, bytes) preview of a file, or None if it has none."""
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        if fitz is not None:
+            return "image", _pdf_page_image(file_path)
+        if PdfReader is not None:
+            text = _pdf_text(file_path)
+        else:
+            return None
+    elif suffix == ".docx":
+        text = _docx_text(file_path)
+    elif suffix in TEXT_SUFFIXES:
+        text = _plain_text(file_path)
+    else:
+        return None
+    return "text", _snippet(text).encode("utf-8")
+
+
+# =========================================================
+# Cache
+# =========================================================
+
+def build_preview(file_path: Path):
+    """
+    Return the cached Preview of a file, rendering it if needed.
+    None if the file has no preview (unsupported, or no text in it).
+    """
+    digest = file_digest(file_path)
+    targets = {
+        "image": PREVIEW_DIR / f"{digest}.png",
+        "text": PREVIEW_DIR / f"{digest}.txt",
+    }
+
+    for kind, target in targets.items():
+        if target.exists():
+            os.utime(target)         # mark as recently used
+            return Preview(kind, target) if target.stat().st_size else None
+
+    result = render(file_path)
+    if result is None:
+        return None
+    kind, data = result
+
+    # Written even when empty, so a text-less scan is not parsed again
+    PREVIEW_DIR.mkdir(parents=True, exist_ok=True)
+    target = targets[kind]
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, target)
+
+    prune_previews()
+    return Preview(kind, target) if data else None
+
+
+def prune_previews(keep: int = MAX_CACHED_PREVIEWS):
+    """Drop least recently used previews beyond `keep`."""
+    previews = sorted(
+        (p for p in PREVIEW_DIR.iterdir() if p.suffix in (".png", ".txt")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for path in previews[keep:]:
+        path.unlink(missing_ok=True)
+
+
+class PreviewWorker:
+    """Background pool that builds previews, one job per file at a time."""
+
+    def __init__(self, workers: int = PREVIEW_WORKERS):
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="preview")
+        self._pending = {}          # file path -> Future
+        self._lock = threading.Lock()
+
+    def request(self, file_path: Path):
+        """Start (or join) building the preview of a file. Returns a Future."""
+        with self._lock:
+            future = self._pending.get(file_path)
+            if future is not None:
+                return future
+            future = self._pending[file_path] = self._pool.submit(
+                build_preview, file_path
+            )
+        # Outside the lock: runs at once if the job has already finished
+        future.add_done_callback(lambda _: self._done(file_path))
+        return future
+
+    def _done(self, file_path):
+        with self._lock:
+            self._pending.pop(file_path, None)
+
+    async def get(self, file_path: Path, timeout: float):
+        """
+        Wait up to `timeout` seconds for a file's preview. The job keeps
+        running after a timeout, so asking again later picks it up.
+        """
+        future = asyncio.wrap_future(self.request(file_path))
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
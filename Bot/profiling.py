@@ -0,0 +1,160 @@
+"""
+On-demand profiling of the running bot (admin /profile command).
+
+A ProfileSession turns on cProfile (and tracemalloc) in the bot process
+for the next N queries or T seconds, whichever comes first, then builds
+a report:
+
+- a summary of the hot path stages (encode, search, decision, sending);
+- the top functions by cumulative time;
+- the source lines that allocated the most memory during the session.
+
+cProfile sees everything that runs on the event loop thread while the
+session is active, including other chats' updates; it measures CPU time
+spent in Python frames, so time awaited on the network is not counted.
+Queries are encoded in a worker thread (see encode_within) that cProfile
+does not see; the worker reports each encode's wall time, which is listed
+as a timed span in the summary.
+In webhook mode each worker process profiles itself only.
+"""
+
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+# (function name, label) of the stages summarized at the top of a report
+HOT_PATH = (
+    ("rate_limit", "rate limiting"),
+    ("query_gate", "lexical gate"),
+    ("encode_query", "query encoding"),
+    ("rescore", "follow-up re-scoring"),
+    ("semantic_search", "FAISS search"),
+    ("decide", "filtering / decision"),
+    ("send_chunks", "reply sending"),
+)
+
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+TRACEMALLOC_FRAMES = 5
+
+
+class ProfileSession:
+    """One profiling window: max_queries queries or max_seconds seconds."""
+
+    def __init__(self, max_queries: int, max_seconds: float, memory: bool = True):
+        self.max_queries = max_queries
+        self.max_seconds = max_seconds
+        self.memory = memory and not tracemalloc.is_tracing()
+
+        self.queries = 0
+        self.spans = {}         # label -> (calls, total seconds)
+        self.started = time.perf_counter()
+        self.finished = None
+        self._profile = cProfile.Profile()
+
+        if self.memory:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._baseline = tracemalloc.take_snapshot()
+        self._profile.enable()
+
+    @property
+    def active(self) -> bool:
+        return self.finished is None
+
+    def query_done(self) -> bool:
+        """Count a handled query; True once the session should end."""
+        self.queries += 1
+        return self.queries >= self.max_queries or self.expired()
+
+    def add_span(self, label: str, seconds: float):
+        """Time one run of a stage that runs outside the profiled thread."""
+        if self.active:
+            calls, total = self.spans.get(label, (0, 0.0))
+            self.spans[label] = (calls + 1, total + seconds)
+
+    def expired(self) -> bool:
+        return time.perf_counter() - self.started >= self.max_seconds
+
+    def stop(self):
+        if not self.active:
+            return
+        self._profile.disable()
+        self.finished = time.perf_counter()
+
+        self._allocations = []
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._allocations = snapshot.compare_to(self._baseline, "lineno")
+
+    # -------------------------
+    # Report
+    # -------------------------
+
+    def summary(self) -> str:
+        """Short, chat-sized report."""
+        stats = pstats.Stats(self._profile).stats
+        elapsed = self.finished - self.started
+
+        lines = [
+            f"🔬 Profile: {self.queries} queries in {elapsed:.1f}s",
+            "",
+            "Hot path (CPU ms total · calls · ms/call):",
+        ]
+        for name, label in HOT_PATH:
+            calls = total = 0
+            for (_, _, func), (_, ncalls, _, cumtime, _) in stats.items():
+                if func == name:
+                    calls += ncalls
+                    total += cumtime
+            if calls:
+                lines.append(
+                    f"• {label}: {1000 * total:.1f} · {calls} · {1000 * total / calls:.2f}"
+                )
+
+        if self.spans:
+            lines += ["", "Timed spans (wall ms total · calls · ms/call):"]
+            for label, (calls, total) in self.spans.items():
+                lines.append(
+                    f"• {label}: {1000 * total:.1f} · {calls} · {1000 * total / calls:.2f}"
+                )
+
+        if self._allocations:
+            lines += ["", "Top allocations (KiB net · blocks):"]
+            for stat in self._allocations[:5]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"• {_short(frame.filename)}:{frame.lineno}: "
+                    f"{stat.size_diff / 1024:+.0f} · {stat.count_diff:+d}"
+                )
+
+        return "\n".join(lines)
+
+    def full_report(self) -> str:
+        """Summary, cProfile listing and allocation table as plain text."""
+        out = io.StringIO()
+        out.write(self.summary() + "\n\n")
+
+        out.write("=" * 72 + "\nTop functions by cumulative time\n" + "=" * 72 + "\n")
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+        out.write("=" * 72 + "\nTop functions by own time\n" + "=" * 72 + "\n")
+        stats.sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+
+        if self._allocations:
+            out.write("=" * 72 + "\nTop allocations during the session\n" + "=" * 72 + "\n")
+            for stat in self._allocations[:TOP_ALLOCATIONS]:
+                out.write(f"{stat}\n")
+                for line in stat.traceback.format()[-2 * TRACEMALLOC_FRAMES:]:
+                    out.write(f"    {line}\n")
+
+        return out.getvalue()
+
+
+def _short(filename: str) -> str:
+    """Last two path components, enough to tell files apart."""
+    parts = filename.replace("\\", "/").rsplit("/", 2)
+    return "/".join(parts[-2:])
@@ -0,0 +1,165 @@
+"""
+Persistent query-embedding cache.
+
+Query embeddings are stored in SQLite keyed by (model id, normalized query
+text), warmed into an in-memory LRU at startup and bounded in both places,
+so popular questions skip the MiniLM forward pass even right after a
+restart or deploy.
+
+The SQLite connection is opened per process (webhook workers are forked),
+and the database runs in WAL mode so several workers can share one file.
+"""
+
+from collections import OrderedDict
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_embeddings (
+    model     TEXT NOT NULL,
+    query     TEXT NOT NULL,
+    vector    BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, query)
+);
+CREATE INDEX IF NOT EXISTS query_embeddings_lru
+    ON query_embeddings (model, last_used);
+"""
+
+FLUSH_EVERY = 50      # batch last_used updates for cache hits
+TRIM_SLACK = 0.1      # let the table grow 10% past the bound before trimming
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: case and whitespace do not change the embedding."""
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """LRU of query embeddings, backed by a bounded SQLite table."""
+
+    def __init__(self, path, model_id: str, max_entries: int):
+        self.path = str(path)
+        self.model_id = model_id
+        self.max_entries = max_entries
+
+        self._memory = OrderedDict()     # key -> float32 vector
+        self._touched = {}               # key -> last_used, not yet flushed
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+        self._rows = 0                   # approximate row count on disk
+
+        # A query may be looked up more than once before it is encoded (the
+        # encode worker re-checks), so a miss is counted when its embedding
+        # is stored rather than at lookup: misses == encodes.
+        self.hits = 0
+        self.misses = 0
+
+        self._warm()
+
+    # -------------------------
+    # SQLite
+    # -------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        # Never reuse a connection inherited across fork()
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _warm(self):
+        self._rows = self._db().execute(
+            "SELECT COUNT(*) FROM query_embeddings WHERE model = ?",
+            (self.model_id,),
+        ).fetchone()[0]
+
+        rows = self._db().execute(
+            "SELECT query, vector FROM query_embeddings WHERE model = ? "
+            "ORDER BY last_used DESC LIMIT ?",
+            (self.model_id, self.max_entries),
+        ).fetchall()
+
+        # Oldest first, so the most recently used end up at the LRU tail
+        for query, blob in reversed(rows):
+            self._memory[query] = np.frombuffer(blob, dtype=np.float32)
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        db = self._db()
+        with db:
+            db.executemany(
+                "UPDATE query_embeddings SET last_used = ? "
+                "WHERE model = ? AND query = ?",
+                [(ts, self.model_id, q) for q, ts in self._touched.items()],
+            )
+        self._touched.clear()
+
+    # -------------------------
+    # Public API
+    # -------------------------
+
+    def get(self, text: str):
+        """Cached embedding for a query, or None."""
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is None:
+                return None
+
+            self.hits += 1
+            self._memory.move_to_end(key)
+            self._touched[key] = time.time()
+            if len(self._touched) >= FLUSH_EVERY:
+                self._flush_touched()
+            return vector
+
+    def put(self, text: str, vector: np.ndarray):
+        """Store an embedding in memory and on disk, evicting LRU entries."""
+        key = normalize_query(text)
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self.misses += 1
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                evicted, _ = self._memory.popitem(last=False)
+                self._touched.pop(evicted, None)
+
+            self._flush_touched()
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings "
+                    "(model, query, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (self.model_id, key, vector.tobytes(), time.time()),
+                )
+                self._rows += 1
+
+                if self._rows > self.max_entries * (1 + TRIM_SLACK):
+                    db.execute(
+                        "DELETE FROM query_embeddings WHERE model = ? AND query IN ("
+                        "  SELECT query FROM query_embeddings WHERE model = ? "
+                        "  ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+                        ")",
+                        (self.model_id, self.model_id, self.max_entries),
+                    )
+                    self._rows = self.max_entries
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._memory)
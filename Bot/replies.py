@@ -0,0 +1,131 @@
+"""
+Reply rendering and message splitting for the Telegram bot.
+
+Telegram rejects messages longer than 4096 characters (counted in UTF-16
+code units). Long answers, and especially merged answers, are split into
+chunks at paragraph boundaries and sent one after another, so the first
+part reaches the user while later parts are still being assembled.
+"""
+
+from telegram.constants import MessageLimit
+
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+
+MERGE_SEPARATOR = "\n\n---\n\n"
+
+
+# -------------------------
+# Rendering (cached per entry)
+# -------------------------
+
+def render_answer(answer: str) -> str:
+    """Normalize a KB answer once so replies can reuse it as-is."""
+    return "\n".join(line.rstrip() for line in answer.strip().splitlines())
+
+
+def rendered(item: dict) -> str:
+    """Return the cached rendered answer of a KB entry."""
+    text = item.get("_rendered")
+    if text is None:
+        text = item["_rendered"] = render_answer(item["answer"])
+    return text
+
+
+# -------------------------
+# Splitting
+# -------------------------
+
+def text_length(text: str) -> int:
+    """Length as Telegram counts it (UTF-16 code units)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _hard_split(text: str, limit: int):
+    """Split on words, or mid-word if a single word is too long."""
+    chunk = ""
+    for word in text.split(" "):
+        candidate = f"{chunk} {word}" if chunk else word
+        if text_length(candidate) <= limit:
+            chunk = candidate
+            continue
+        if chunk:
+            yield chunk
+        while text_length(word) > limit:
+            cut = limit
+            while text_length(word[:cut]) > limit:
+                cut -= 1
+            yield word[:cut]
+            word = word[cut:]
+        chunk = word
+    if chunk:
+        yield chunk
+
+
+def split_text(text: str, limit: int = MAX_MESSAGE_LENGTH):
+    """
+    Split text into pieces of at most `limit`, preferring paragraph
+    breaks, then line breaks, then spaces.
+    """
+    if text_length(text) <= limit:
+        return [text]
+
+    pieces = []
+    for separator in ("\n\n", "\n"):
+        if separator in text:
+            current = ""
+            for block in text.split(separator):
+                candidate = f"{current}{separator}{block}" if current else block
+                if text_length(candidate) <= limit:
+                    current = candidate
+                    continue
+                if current:
+                    pieces.append(current)
+                current = ""
+                if text_length(block) <= limit:
+                    current = block
+                else:
+                    pieces.extend(split_text(block, limit))
+            if current:
+                pieces.append(current)
+            return pieces
+
+    return list(_hard_split(text, limit))
+
+
+def iter_chunks(parts, separator: str = "", limit: int = MAX_MESSAGE_LENGTH):
+    """
+    Pack an iterable of text parts into message-sized chunks.
+
+    Parts are consumed lazily: a chunk is yielded as soon as the next part
+    would overflow it, so the caller can send it before later parts exist.
+    """
+    current = ""
+    for part in parts:
+        candidate = f"{current}{separator}{part}" if current else part
+        if text_length(candidate) <= limit:
+            current = candidate
+            continue
+
+        if current:
+            yield current
+        pieces = split_text(part, limit)
+        yield from pieces[:-1]
+        current = pieces[-1]
+
+    if current:
+        yield current
+
+
+async def send_chunks(message, chunks, reply_markup=None):
+    """
+    Reply with each chunk as soon as it is available.
+    The reply markup (buttons) is attached to the last chunk only.
+    """
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            await message.reply_text(pending)
+        pending = chunk
+
+    if pending is not None:
+        await message.reply_text(pending, reply_markup=reply_markup)
@@ -0,0 +1,86 @@
+"""
+Optional second-stage reranker for ambiguous queries.
+
+The first stage (FAISS + decision.decide) is fast but only compares
+embeddings. When it finds no dominant result, a cross-encoder reads the
+query together with each remaining candidate and scores how well the
+entry answers it; decision.rerank_decision() then picks from that.
+
+Cost stays bounded:
+- clear queries never reach the reranker;
+- scores are cached per (query, KB version, entry), so a repeated query
+  costs dictionary lookups;
+- scoring runs in a worker thread with a time budget. If it is not done
+  in time the bot answers from the first-stage ranking; the scores are
+  still cached when they arrive, for the next time the query comes up.
+"""
+
+from collections import OrderedDict
+import asyncio
+import inspect
+import threading
+
+from query_cache import normalize_query
+
+RERANK_CACHE_SIZE = 20_000
+PASSAGE_CHARS = 1000        # answer text given to the cross-encoder per entry
+
+
+class Reranker:
+    """Cross-encoder relevance scores (0-1) with an LRU score cache."""
+
+    def __init__(self, model_name: str, cache_size: int = RERANK_CACHE_SIZE):
+        # Imported here: only needed when a reranker is configured
+        from sentence_transformers import CrossEncoder
+        import torch
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name)
+        # predict()'s keyword is activation_fct up to sentence-transformers
+        # 3.x (3.0.1 is pinned in the README) and activation_fn from 4.0
+        keyword = (
+            "activation_fn"
+            if "activation_fn" in inspect.signature(self.model.predict).parameters
+            else "activation_fct"
+        )
+        self._predict_options = {keyword: torch.nn.Sigmoid(), "show_progress_bar": False}
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()     # (query, kb, version, entry id) -> score
+        self._lock = threading.Lock()
+
+    def score(self, query: str, kb, items):
+        """Relevance of each entry of a LoadedKB for the query."""
+        text = normalize_query(query)
+        keys = [(text, kb.name, kb.version, item["id"]) for item in items]
+
+        with self._lock:
+            scores = [self._cache.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self._cache.move_to_end(key)
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            pairs = [
+                (query, f"{items[i]['question']}\n{items[i]['answer'][:PASSAGE_CHARS]}")
+                for i in missing
+            ]
+            predicted = self.model.predict(pairs, **self._predict_options)
+            with self._lock:
+                for i, score in zip(missing, predicted):
+                    scores[i] = self._cache[keys[i]] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    async def score_within(self, query: str, kb, items, budget: float):
+        """score() in a worker thread; None if it takes longer than budget seconds."""
+        job = asyncio.ensure_future(asyncio.to_thread(self.score, query, kb, items))
+        # A job that fails after the timeout has nobody awaiting it
+        job.add_done_callback(lambda j: j.cancelled() or j.exception())
+        try:
+            return await asyncio.wait_for(asyncio.shield(job), budget)
+        except asyncio.TimeoutError:
+            return None
@@ -0,0 +1,162 @@
+"""
+Lexical suggestion index for inline-mode autocomplete.
+
+Built once per index version from KB questions and tags. Lookups never
+touch the transformer:
+
+- complete words are matched exactly, or fuzzily through a trigram index
+  over the vocabulary (so small typos still match);
+- the last, partially typed word is matched by prefix with a binary
+  search over the sorted vocabulary.
+
+Entries are ranked by the IDF-weighted share of query words they match.
+Stopwords ("what", "how", "does", …) are neither indexed nor counted, and
+a query word the KB does not contain at all weighs as much as the rarest
+word, so a match on filler words alone never scores high.
+"""
+
+from bisect import bisect_left
+import math
+import re
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words that say nothing about the topic of a question
+STOPWORDS = frozenset("""
+a an and are as at be by can could do does did for from how i if in is it
+its me my of on or please tell the this that to was what when where which
+who why will with would you your explain define describe give about
+""".split())
+
+MAX_PREFIX_EXPANSIONS = 50      # vocabulary words a partial word may expand to
+MIN_TRIGRAM_SIMILARITY = 0.5    # Jaccard similarity for a fuzzy word match
+QUESTION_WEIGHT = 1.0
+TAG_WEIGHT = 0.5
+
+
+def tokenize(text: str):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(word: str):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestionIndex:
+    """Prefix + trigram index over KB questions and tags."""
+
+    def __init__(self, kb):
+        self.kb = kb
+        self.postings = {}          # word -> {entry row: weight}
+
+        for row, item in enumerate(kb):
+            for word in tokenize(item.get("question", "")):
+                self._add(word, row, QUESTION_WEIGHT)
+            for tag in item.get("tags", []):
+                for word in tokenize(tag):
+                    self._add(word, row, TAG_WEIGHT)
+
+        self.vocab = sorted(self.postings)
+        self.idf = {
+            word: math.log(1 + len(kb) / len(rows))
+            for word, rows in self.postings.items()
+        }
+        # Weight of a query word with no match: that of a word in one entry
+        self.max_idf = math.log(1 + len(kb))
+
+        self.trigram_words = {}     # trigram -> {word, ...}
+        for word in self.vocab:
+            for gram in trigrams(word):
+                self.trigram_words.setdefault(gram, set()).add(word)
+
+    def _add(self, word, row, weight):
+        if word in STOPWORDS:
+            return
+        rows = self.postings.setdefault(word, {})
+        rows[row] = max(rows.get(row, 0.0), weight)
+
+    # -------------------------
+    # Word expansion
+    # -------------------------
+
+    def prefix_words(self, prefix: str):
+        start = bisect_left(self.vocab, prefix)
+        words = []
+        for word in self.vocab[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        return words
+
+    def fuzzy_words(self, word: str):
+        if word in self.postings:
+            return [word]
+        if len(word) < 3:
+            return []
+
+        grams = trigrams(word)
+        counts = {}
+        for gram in grams:
+            for candidate in self.trigram_words.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+
+        return [
+            candidate for candidate, shared in counts.items()
+            if shared / len(grams | trigrams(candidate)) >= MIN_TRIGRAM_SIMILARITY
+        ]
+
+    # -------------------------
+    # Search
+    # -------------------------
+
+    def search(self, text: str, limit: int = 10, require_all: bool = False):
+        """
+        Return [(score, item), ...] best first. score is in [0, 1]: the
+        IDF-weighted fraction of the query's content words the entry
+        matched. With require_all, only entries matching every one of them
+        are returned.
+        """
+        words = tokenize(text)
+        if not words:
+            return []
+
+        # The last word is still being typed unless followed by a space.
+        # A partial stopword is skipped; typing on turns it into a prefix.
+        partial = None if text[-1:].isspace() else words.pop()
+        words = [word for word in words if word not in STOPWORDS]
+
+        groups = [self.fuzzy_words(word) for word in words]
+        if partial and partial not in STOPWORDS:
+            groups.append(self.prefix_words(partial) or self.fuzzy_words(partial))
+        if not groups:
+            return []
+
+        scores = {}
+        matched = {}                # row -> number of groups it matched
+        total = 0.0
+        for group in groups:
+            weight = max((self.idf[w] for w in group), default=self.max_idf)
+            total += weight
+
+            best = {}
+            for word in group:
+                for row, field_weight in self.postings[word].items():
+                    best[row] = max(best.get(row, 0.0), field_weight)
+            for row, field_weight in best.items():
+                scores[row] = scores.get(row, 0.0) + weight * field_weight
+                matched[row] = matched.get(row, 0) + 1
+
+        if require_all:
+            scores = {
+                row: score for row, score in scores.items()
+                if matched[row] == len(groups)
+            }
+        if not scores:
+            return []
+
+        ranked = sorted(
+            scores.items(),
+            key=lambda kv: (-kv[1], len(self.kb[kv[0]].get("question", ""))),
+        )
+        return [(score / total, self.kb[row]) for row, score in ranked[:limit]]
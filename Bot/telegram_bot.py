@@ -15,17 +15,28 @@ Design goals:
 - Long-term maintainability
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import asyncio
+import io
 import json
+import sys
 
 import faiss
 from sentence_transformers import SentenceTransformer
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     MessageHandler,
     ContextTypes,
     filters,
@@ -40,6 +51,38 @@ import time
 import os
 from dotenv import load_dotenv
 
+from decision import DEFAULT_THRESHOLDS, decide, is_combo_query, rerank_decision
+from replies import (
+    MERGE_SEPARATOR,
+    iter_chunks,
+    rendered,
+    send_chunks,
+    split_text,
+)
+from suggest import SuggestionIndex
+from query_cache import QueryEmbeddingCache
+from kb_pool import KBPool, LoadedKB, estimate_footprint
+from guard import RateLimiter, build_vocabulary, query_gate
+from compact_kb import CompactKB
+from profiling import ProfileSession
+from conversation import ConversationStore, blend, is_follow_up, rescore, strip_opener
+from previews import PreviewWorker, can_preview
+from rerank import Reranker
+from deadline import Deadline, QueryMetrics
+from chat_kbs import ChatKBStore
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import index_store  # noqa: E402
+from source_files import (  # noqa: E402
+    build_bundle,
+    bundle_name,
+    module_files,
+    module_of,
+    resolve_source,
+    source_paths,
+)
+
 # from admin_access import is_admin, start_ngrok
 
 # ============================================================
@@ -58,18 +101,60 @@ LOGGER = logging.getLogger(__name__)
 
 load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Optional, e.g. "http://127.0.0.1:8081/bot" for a local Bot API stand-in
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
 
 DATA_DIR = Path("./Data")
-NOTES_DIR = Path("./Notes")
+MODEL_NAME = "all-MiniLM-L6-v2"
 
 TOP_K_RESULTS = 5
-MIN_MERGE_SCORE = 0.55
-
-CONFIDENCE_LEVELS = [
-    (0.70, "high"),
-    (0.60, "medium"),
-    (0.50, "low"),
-]
+RELATED_BUTTONS = 3              # "Related" buttons under an answer
+RELATED_LABEL_LENGTH = 48        # button text is cut to this many characters
+
+# Optional cross-encoder for queries without a dominant result (rerank.py),
+# e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"; unset = first stage only
+RERANKER_MODEL = os.getenv("BOT_RERANKER_MODEL", "")
+RERANK_BUDGET_SECONDS = float(os.getenv("BOT_RERANK_BUDGET_MS", "150")) / 1000
+
+# Per-query latency budget (deadline.py): phases that would not fit in
+# what is left are replaced by cheaper ones
+QUERY_BUDGET_SECONDS = float(os.getenv("BOT_QUERY_BUDGET_MS", "2000")) / 1000
+ENCODE_SHARE = 0.6               # of the budget the model may take to encode
+MERGE_MIN_REMAINING = 0.3        # share that must be left to merge or rerank
+
+# Persistent query-embedding cache (survives restarts)
+QUERY_CACHE_PATH = DATA_DIR / "query_cache.sqlite3"
+QUERY_CACHE_MAX_ENTRIES = 20_000     # ~1.5 KB each for MiniLM (384 floats)
+
+# Knowledge bases (see kb_pool.py): several named KBs share one model
+DEFAULT_KB = os.getenv("BOT_DEFAULT_KB", index_store.DEFAULT_KB)
+KB_MEMORY_BUDGET_MB = int(os.getenv("BOT_KB_MEMORY_BUDGET_MB", "1024"))
+# chat id -> selected KB (see chat_kbs.py)
+CHAT_KB_PATH = DATA_DIR / "chat_kbs.sqlite3"
+# Earlier releases kept the selection in JSON; imported once, then removed
+LEGACY_CHAT_KB_FILES = (Path("chat_kbs.json"), DATA_DIR / "chat_kbs.json")
+
+# Rate limits (token buckets): burst size and refill per minute
+USER_RATE_BURST = int(os.getenv("BOT_USER_RATE_BURST", "5"))
+USER_RATE_PER_MINUTE = float(os.getenv("BOT_USER_RATE_PER_MINUTE", "20"))
+CHAT_RATE_BURST = int(os.getenv("BOT_CHAT_RATE_BURST", "20"))
+CHAT_RATE_PER_MINUTE = float(os.getenv("BOT_CHAT_RATE_PER_MINUTE", "60"))
+
+# Inline mode (@bot partial text)
+INLINE_RESULTS = 8
+INLINE_CACHE_SECONDS = 60
+INLINE_PAUSE_SECONDS = 0.8       # wait this long before a semantic fallback
+INLINE_MIN_LEXICAL_SCORE = 0.6   # lexical matches weaker than this trigger it
+
+# /profile defaults: whichever limit is reached first ends the session
+PROFILE_DEFAULT_QUERIES = 20
+PROFILE_MAX_SECONDS = 300
+
+# Telegram rejects documents above 50 MB from bots
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# How long a "Preview" click waits for a preview still being rendered
+PREVIEW_TIMEOUT_SECONDS = 10
 
 CONFIDENCE_MESSAGES = {
     "high": "✅ I’m fairly confident about this:",
@@ -81,20 +166,6 @@ CONFIDENCE_MESSAGES = {
     ),
 }
 
-COMBO_KEYWORDS = (
-    "and", "vs", "versus", "difference", "compare",
-    "comparison", "between"
-)
-
-# Dominance threshold:
-# If the top result is this much better than the second-best,
-# we assume a single clear answer and avoid merging.
-DOMINANCE_MARGIN = 0.12
-
-MIN_COMMON_TAGS = 2
-
-CONCEPT_SIM_THRESHOLD = 0.60  # tunable
-
 ADMIN_STATE_FILE = Path("admin_state.json")
 ADMIN_CONFIG_FILE = Path("admin_config.json")
 
@@ -102,64 +173,280 @@ ADMIN_CONFIG_FILE = Path("admin_config.json")
 # Load models and data (once at startup)
 # ============================================================
 
-INDEX = faiss.read_index(str(DATA_DIR / "embeddings.faiss"))
-KB = json.loads((DATA_DIR / "meta.json").read_text(encoding="utf-8"))
+EMBED_MODEL = SentenceTransformer(MODEL_NAME)
+
+QUERY_CACHE = QueryEmbeddingCache(
+    QUERY_CACHE_PATH, MODEL_NAME, QUERY_CACHE_MAX_ENTRIES
+)
+LOGGER.info("Query cache warmed with %d embeddings", len(QUERY_CACHE))
+
+RERANKER = Reranker(RERANKER_MODEL) if RERANKER_MODEL else None
+
+# One encoding at a time off the event loop, so a slow encode can be
+# abandoned when it overruns the query budget
+ENCODE_POOL = ThreadPoolExecutor(1, thread_name_prefix="encode")
+
+METRICS = QueryMetrics()
+
+
+# Memory-map the index read-only so worker processes (webhook mode)
+# share one copy of the vectors through the page cache.
+INDEX_IO_FLAGS = (
+    getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    | faiss.IO_FLAG_READ_ONLY
+)
+
 
-EMBED_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+def load_index(manifest: dict):
+    """
+    Load the index, metadata, concept embeddings and related-entries graph
+    of one published version. All come from the same immutable version
+    directory, so graph rows always match KB rows.
+    Returns (index, entries as dicts, concepts matrix, related matrix or None).
+    """
+    paths = manifest["_paths"]
+    index = faiss.read_index(str(paths["index"]), INDEX_IO_FLAGS)
+    items = json.loads(paths["meta"].read_text(encoding="utf-8"))
+
+    if paths.get("concepts"):
+        concepts = np.load(paths["concepts"])
+    else:
+        # Legacy layout: no precomputed question embeddings
+        concepts = EMBED_MODEL.encode(
+            [item["question"] for item in items],
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
 
-for item in KB:
-    item["_concept_embedding"] = EMBED_MODEL.encode(
-        item["question"],
-        convert_to_numpy=True,
-        normalize_embeddings=True
+    # Precomputed neighbours (older versions have none)
+    related = np.load(paths["related"]) if paths.get("related") else None
+
+    return index, items, concepts, related
+
+
+def load_knowledge_base(name: str) -> LoadedKB:
+    """
+    Load the live version of a named KB. The parsed JSON entries are only
+    used to build the compact column store (compact_kb.py) and then dropped.
+    """
+    manifest = index_store.load_manifest(root=index_store.kb_root(name))
+    index, raw_items, concepts, related = load_index(manifest)
+
+    vocabulary = build_vocabulary(raw_items)
+    compact = CompactKB(raw_items, concepts, related)
+    del raw_items
+
+    items = compact.entries
+    kb = LoadedKB(
+        name=name,
+        manifest=manifest,
+        index=index,
+        items=items,
+        by_id={item["id"]: item for item in items},
+        suggestions=SuggestionIndex(items),
+        vocabulary=vocabulary,
+        footprint=estimate_footprint(manifest, compact.nbytes()),
+    )
+    LOGGER.info(
+        "Loaded KB %s version %s (%d entries, ~%.1f MB)",
+        name, kb.version, len(items), kb.footprint / 2**20,
     )
+    return kb
+
+
+def live_version(name: str):
+    # Reading the CURRENT pointer is cheap, so this runs per update
+    return index_store.current_version(index_store.kb_root(name))
+
+
+KBS = KBPool(load_knowledge_base, live_version, KB_MEMORY_BUDGET_MB * 2**20)
+
+# Loaded up front so webhook workers inherit it when forked
+KBS.get(DEFAULT_KB)
+
+
+CHAT_KBS = ChatKBStore(CHAT_KB_PATH)
+for legacy_file in LEGACY_CHAT_KB_FILES:
+    if CHAT_KBS.import_json(legacy_file):
+        LOGGER.info("Imported chat KB selections from %s", legacy_file)
+
+USER_LIMITER = RateLimiter(USER_RATE_BURST, USER_RATE_PER_MINUTE)
+CHAT_LIMITER = RateLimiter(CHAT_RATE_BURST, CHAT_RATE_PER_MINUTE)
+
+# What each chat was last answered (for follow-up questions)
+CONVERSATIONS = ConversationStore()
+
+# Source file previews, rendered in the background (previews.py)
+PREVIEWS = PreviewWorker()
+
+
+def rate_limit(user_id, chat_id):
+    """
+    Take a token from the user's and the chat's bucket.
+    Returns None if allowed, else the Verdict that refused the request.
+    """
+    if user_id is not None:
+        verdict = USER_LIMITER.acquire(user_id)
+        if not verdict.allowed:
+            return verdict
+    if chat_id is not None and chat_id != user_id:
+        verdict = CHAT_LIMITER.acquire(chat_id)
+        if not verdict.allowed:
+            return verdict
+    return None
+
+
+async def kb_for_chat(chat_id) -> LoadedKB:
+    """
+    The KB selected for a chat (or, for inline queries, a user), with any
+    newly published version swapped in. Loads run off the event loop.
+    """
+    name = CHAT_KBS.get(chat_id, DEFAULT_KB)
+    try:
+        return await KBS.get_async(name)
+    except FileNotFoundError:
+        # Selected KB has been removed since
+        LOGGER.warning("KB %s is gone; using %s for chat %s", name, DEFAULT_KB, chat_id)
+        return await KBS.get_async(DEFAULT_KB)
+
 
 # ============================================================
 # Core retrieval & reasoning helpers
 # ============================================================
 
-def semantic_search(query: str, top_k: int):
+def encode_query(query: str) -> np.ndarray:
+    """
+    Encode a query into a normalized 1-D embedding.
+    Repeated queries are served from the persistent cache.
+    """
+    vector = QUERY_CACHE.get(query)
+    if vector is None:
+        vector = EMBED_MODEL.encode(
+            query,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        QUERY_CACHE.put(query, vector)
+    return vector
+
+
+async def encode_within(query: str, timeout: float):
+    """
+    encode_query() with a time limit: None if the model does not answer
+    within timeout seconds. An abandoned encode that already started still
+    finishes and fills the query cache; one still queued is cancelled.
+    """
+    vector = QUERY_CACHE.get(query)
+    if vector is not None or timeout <= 0:
+        return vector
+
+    loop = asyncio.get_running_loop()
+    job = asyncio.wrap_future(ENCODE_POOL.submit(timed_encode, query, loop))
+    try:
+        return await asyncio.wait_for(job, timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+def timed_encode(query: str, loop) -> np.ndarray:
+    """
+    encode_query() as run on the encode worker. cProfile and the query
+    metrics only see the event loop thread, so the worker reports its own
+    wall time back to it (record_encode_time).
     """
-    Encode a query and retrieve top_k most similar KB entries.
-    Returns (scores, indices).
+    started = time.perf_counter()
+    try:
+        return encode_query(query)
+    finally:
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(record_encode_time, time.perf_counter() - started)
+
+
+def record_encode_time(seconds: float):
+    METRICS.record_span("encode", seconds)
+    if PROFILE is not None:
+        PROFILE.add_span("query encoding (worker thread)", seconds)
+
+
+def semantic_search(kb: LoadedKB, query_embedding: np.ndarray, top_k: int):
     """
-    vector = EMBED_MODEL.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(vector)
-    scores, indices = INDEX.search(vector, top_k)
+    Retrieve top_k most similar entries of a KB for a normalized query
+    embedding. Returns (scores, indices).
+    """
+    vector = query_embedding.reshape(1, -1).astype(np.float32)
+    scores, indices = kb.index.search(vector, top_k)
     return scores[0], indices[0]
 
 
-# -------------------------
-# Similarity & confidence
-# -------------------------
+def retrieve(kb: LoadedKB, query_embedding: np.ndarray, combo_query: bool, rows=None):
+    """
+    Search the KB (or, with rows given, only re-score those rows) and
+    decide how to answer. Returns (decision, candidate rows).
+    """
+    if rows is None:
+        scores, indices = semantic_search(kb, query_embedding, TOP_K_RESULTS)
+    else:
+        scores, indices = rescore(kb.index, rows, query_embedding)
+    candidates = [(s, kb.items[i]) for s, i in zip(scores, indices) if i >= 0]
 
-def confidence_from_score(score: float) -> str:
-    """Map cosine similarity score to a confidence label."""
-    for threshold, level in CONFIDENCE_LEVELS:
-        if score >= threshold:
-            return level
-    return "none"
+    decision = decide(candidates, query_embedding, combo_query, DEFAULT_THRESHOLDS)
+    return decision, [item.row for _, item in candidates]
 
 
-def is_dominant(best_score: float, second_score: float) -> bool:
+async def rerank(kb: LoadedKB, query: str, decision, budget: float):
     """
-    Determine whether the top result clearly dominates the second-best.
+    Second stage for an ambiguous decision: re-decide from cross-encoder
+    scores, or keep the first-stage decision if they miss the time budget.
     """
-    return (best_score - second_score) >= DOMINANCE_MARGIN
+    items = [item for _, item in decision.results]
+    try:
+        scores = await RERANKER.score_within(query, kb, items, budget)
+    except Exception:
+        LOGGER.exception("Reranking failed for query: %s", query)
+        return decision
+
+    if scores is None:
+        LOGGER.info("Reranking over budget, first-stage ranking kept: %s", query)
+        return decision
+    return rerank_decision(decision, scores)
 
 
-def tag_overlap_count(tags_a, tags_b) -> int:
-    """Return number of common tags between two tag lists."""
-    return len(set(tags_a) & set(tags_b))
+async def answer_degraded(message, kb: LoadedKB, query: str, deadline: Deadline):
+    """
+    Cheap answer when the model cannot be used within the query budget:
+    the best keyword match if it contains every content word of the query
+    (stopwords aside), else a busy notice.
+    """
+    matches = kb.suggestions.search(query + " ", limit=1, require_all=True)
+    if matches:
+        item = matches[0][1]
+        deadline.degrade("lexical_answer")
+        deadline.outcome = "answered"
+        await send_chunks(
+            message,
+            split_text(
+                "⚡ I’m very busy right now, so this is a quick keyword match:\n\n"
+                f"❓ {item['question']}\n\n{rendered(item)}"
+            ),
+            reply_markup=answer_markup(item),
+        )
+        return
+
+    deadline.degrade("busy")
+    deadline.outcome = "declined"
+    await message.reply_text(
+        "⏳ I’m very busy right now. Please ask again in a moment."
+    )
 
 
-def is_concept_demanded_semantic(
-    query_embedding: np.ndarray,
-    item_embedding: np.ndarray
-) -> bool:
-    """Check whether the query semantically demands this concept."""
-    similarity = float(np.dot(query_embedding, item_embedding))
-    return similarity >= CONCEPT_SIM_THRESHOLD
+def remember_answer(chat_id, kb: LoadedKB, embedding, rows, item):
+    """
+    Keep the chat's context for follow-ups: the candidate rows plus the
+    answered entry's related entries.
+    """
+    related = [other.row for other in item.get("_related", [])]
+    rows = list(dict.fromkeys([item.row, *rows, *related]))
+    CONVERSATIONS.remember(chat_id, kb, embedding, rows, item.row)
 
 
 # -------------------------
@@ -178,12 +465,6 @@ def infer_intent(query: str) -> str:
     return "general"
 
 
-def is_combo_query(query: str) -> bool:
-    """Detect whether the query likely demands multiple concepts."""
-    q = query.lower()
-    return any(k in q for k in COMBO_KEYWORDS)
-
-
 # -------------------------
 # Answer construction
 # -------------------------
@@ -215,9 +496,62 @@ def merge_prefix(confidence: str) -> str:
     return "I found several partially related notes. They may help when read together:\n\n"
 
 
-def merge_answers(results):
-    """Merge multiple KB answers safely by concatenation."""
-    return "\n\n---\n\n".join(item["answer"].strip() for _, item in results)
+def merged_reply_parts(results, confidence: str):
+    """
+    Yield the parts of a merged reply one answer at a time
+    (to be joined with MERGE_SEPARATOR), so sending can start
+    before every answer has been assembled.
+    """
+    last = len(results) - 1
+    for i, (_, item) in enumerate(results):
+        part = rendered(item)
+        if i == 0:
+            part = merge_prefix(confidence) + part
+        if i == last:
+            part += f"\n\n_(Combined from {len(results)} related notes.)_"
+        yield part
+
+
+def related_buttons(item, exclude=()):
+    """
+    "Related" buttons from the precomputed neighbour graph
+    (a list lookup, no search at query time).
+    """
+    rows = []
+    for other in item.get("_related", []):
+        if other["id"] in exclude:
+            continue
+        label = other["question"]
+        if len(label) > RELATED_LABEL_LENGTH:
+            label = label[:RELATED_LABEL_LENGTH - 1] + "…"
+        rows.append([
+            InlineKeyboardButton(f"🔗 {label}", callback_data=f"rel:{other['id']}")
+        ])
+        if len(rows) == RELATED_BUTTONS:
+            break
+    return rows
+
+
+def source_file(item, ext):
+    """Resolved path of one of an entry's source files (None if missing)."""
+    paths = source_paths(item) if item else {}
+    file_path = resolve_source(paths[ext]) if ext in paths else None
+    return file_path if file_path and file_path.is_file() else None
+
+
+def download_markup(item_id, ext) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(f"Get {ext.upper()}", callback_data=f"getfile:{item_id}:{ext}")
+    ]])
+
+
+def answer_markup(item) -> InlineKeyboardMarkup:
+    """Buttons under a single answer: source files, then related entries."""
+    source = InlineKeyboardButton(
+        "Get Source Files",
+        callback_data=f"src:{item['id']}",
+    )
+    return InlineKeyboardMarkup([[source]] + related_buttons(item))
 
 # ----------------------------
 # Admin check (bot-side)
@@ -232,125 +566,149 @@ def is_admin(user_id: int) -> bool:
 # Telegram handlers
 # ============================================================
 
-async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_query(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    deadline: Deadline = None,
+) -> None:
     # ------------------------------------------------------------
     # Phase 1: Validate and extract user input
     # ------------------------------------------------------------
     if not update.message:
         return
 
-    query = update.message.text.strip()
+    deadline = deadline or Deadline(QUERY_BUDGET_SECONDS)
 
-    if len(query) < 4:
-        await update.message.reply_text(
-            "😅 That doesn’t look like a real question yet."
-        )
+    user = update.effective_user
+    limited = rate_limit(user.id if user else None, update.message.chat_id)
+    if limited:
+        deadline.outcome = "rate_limited"
+        # Tell the user once per flood, then drop silently
+        if limited.notify:
+            await update.message.reply_text(
+                "⏳ You’re sending questions faster than I can answer. "
+                f"Please wait about {limited.retry_after:.0f}s."
+            )
         return
 
-    # ------------------------------------------------------------
-    # Phase 2: Retrieve candidate KB entries via semantic search
-    # ------------------------------------------------------------
-    scores, indices = semantic_search(query, TOP_K_RESULTS)
-    candidates = [(s, KB[i]) for s, i in zip(scores, indices)]
-
-    # ------------------------------------------------------------
-    # Phase 3: Filter out weak semantic matches
-    # ------------------------------------------------------------
-    relevant = [(s, it) for s, it in candidates if s >= MIN_MERGE_SCORE]
+    chat_id = update.message.chat_id
+    kb = await kb_for_chat(chat_id)
 
-    if not relevant:
-        await update.message.reply_text(CONFIDENCE_MESSAGES["none"])
-        return
+    query = update.message.text.strip()
 
-    # Sort strongest-first for downstream logic
-    relevant.sort(key=lambda x: x[0], reverse=True)
+    # A short "and its complexity?" continues the previous question
+    previous = CONVERSATIONS.get(chat_id, kb)
+    follow_up = previous is not None and is_follow_up(query)
 
     # ------------------------------------------------------------
-    # Phase 4: Prepare semantic context for deeper filtering
+    # Phase 1b: Lexical gate (no model call)
     # ------------------------------------------------------------
-    query_embedding = EMBED_MODEL.encode(
-        query,
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    )
+    rejected = query_gate(query, kb.vocabulary, kb.suggestions.fuzzy_words)
+
+    if rejected == "invalid":
+        deadline.outcome = "declined"
+        await update.message.reply_text(
+            "😅 That doesn’t look like a real question yet."
+        )
+        return
 
-    combo_query = is_combo_query(query)
-    top_tags = relevant[0][1].get("tags", [])
+    if rejected == "unknown" and not follow_up:
+        # Shares no words with the KB: semantic search would not match either
+        # (a follow-up takes its topic from the previous question)
+        deadline.outcome = "declined"
+        await update.message.reply_text(CONFIDENCE_MESSAGES["none"])
+        return
 
     # ------------------------------------------------------------
-    # Phase 5: Enforce conceptual and tag coherence
+    # Phase 2: Retrieve candidate KB entries via semantic search,
+    # then (Phases 3-6) relevance, coherence, confidence and
+    # dominance (pure logic, shared with tune_thresholds.py)
     # ------------------------------------------------------------
-    filtered_relevant = []
-
-    for score, item in relevant:
-        concept_match = is_concept_demanded_semantic(
-            query_embedding,
-            item["_concept_embedding"]
-        )
-
-        common_tags = tag_overlap_count(
-            top_tags,
-            item.get("tags", [])
-        )
+    query_embedding = await encode_within(query, deadline.share(ENCODE_SHARE))
+    if query_embedding is None:
+        # Model overloaded: don't make the user wait for it
+        deadline.degrade("encode_timeout")
+        await answer_degraded(update.message, kb, query, deadline)
+        return
 
-        if concept_match:
-            filtered_relevant.append((score, item))
-        elif combo_query:
-            filtered_relevant.append((score, item))
-        elif common_tags >= MIN_COMMON_TAGS:
-            filtered_relevant.append((score, item))
+    if not deadline.remaining():
+        deadline.degrade("no_search_time")
+        await answer_degraded(update.message, kb, query, deadline)
+        return
 
-    if not filtered_relevant:
+    combo = is_combo_query(strip_opener(query) if follow_up else query)
+    decision = None
+
+    if follow_up:
+        # Blend in the previous topic and re-score the previous
+        # candidates first; fall back to a full search with the blend
+        query_embedding = blend(query_embedding, previous.embedding)
+        decision, rows = retrieve(kb, query_embedding, combo, previous.rows)
+        LOGGER.info("Follow-up %r resolved from context: %s", query, decision.kind)
+
+    if decision is None or decision.kind == "none":
+        decision, rows = retrieve(kb, query_embedding, combo)
+
+    if (
+        decision.kind == "merge"
+        and deadline.remaining() < deadline.budget * MERGE_MIN_REMAINING
+    ):
+        # Little time left: the top result alone, no reranking or merging
+        deadline.degrade("top1_instead_of_merge")
+        decision = decision._replace(kind="single", results=decision.results[:1])
+
+    # No dominant result: let the reranker (if configured) sort it out.
+    # Not for follow-ups, whose text alone lacks the topic.
+    if decision.kind == "merge" and RERANKER and not follow_up:
+        budget = min(RERANK_BUDGET_SECONDS, deadline.remaining())
+        decision = await rerank(kb, query, decision, budget)
+
+    filtered_relevant = decision.results
+    confidence = decision.confidence
+
+    if decision.kind == "none":
+        deadline.outcome = "declined"
         await update.message.reply_text(CONFIDENCE_MESSAGES["none"])
         return
 
-    # ------------------------------------------------------------
-    # Phase 6: Confidence and dominance assessment
-    # ------------------------------------------------------------
-    best_score = filtered_relevant[0][0]
-    second_score = (
-        filtered_relevant[1][0]
-        if len(filtered_relevant) > 1
-        else 0.0
-    )
+    deadline.outcome = "answered"
 
-    confidence = confidence_from_score(best_score)
+    remember_answer(chat_id, kb, query_embedding, rows, filtered_relevant[0][1])
 
     # ------------------------------------------------------------
     # Phase 7: Single-answer resolution path
     # ------------------------------------------------------------
-    if len(filtered_relevant) == 1 or is_dominant(best_score, second_score):
+    if decision.kind == "single":
         item = filtered_relevant[0][1]
         intent = infer_intent(query)
 
         reply = frame_answer(
-            answer=item["answer"],
+            answer=rendered(item),
             intent=intent,
             confidence=confidence,
         )
 
-        button = InlineKeyboardButton(
-            "Get Source Files",
-            callback_data=f"src:{item['id']}",
-        )
-
-        await update.message.reply_text(
-            reply,
-            reply_markup=InlineKeyboardMarkup([[button]]),
+        await send_chunks(
+            update.message,
+            split_text(reply),
+            reply_markup=answer_markup(item),
         )
         return
 
     # ------------------------------------------------------------
     # Phase 8: Multi-answer merge resolution path
     # ------------------------------------------------------------
-    merged = (
-        merge_prefix(confidence)
-        + merge_answers(filtered_relevant)
-        + f"\n\n_(Combined from {len(filtered_relevant)} related notes.)_"
-    )
-
     LOGGER.info("Merged response generated for query: %s", query)
-    await update.message.reply_text(merged)
+    merged_ids = {item["id"] for _, item in filtered_relevant}
+    related = related_buttons(filtered_relevant[0][1], exclude=merged_ids)
+    await send_chunks(
+        update.message,
+        iter_chunks(
+            merged_reply_parts(filtered_relevant, confidence),
+            separator=MERGE_SEPARATOR,
+        ),
+        reply_markup=InlineKeyboardMarkup(related) if related else None,
+    )
 
 
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -362,6 +720,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     data = query.data or ""
+    kb = await kb_for_chat(query.message.chat_id)
 
     # ------------------------------------------------------------
     # 2. Source selection stage:
@@ -370,38 +729,141 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # ------------------------------------------------------------
     if data.startswith("src:"):
         item_id = data.split(":", 1)[1]
-        item = next(it for it in KB if it["id"] == item_id)
+        item = kb.by_id.get(item_id)
+        if item is None:
+            await query.answer("That entry is no longer available.")
+            return
 
-        buttons = [
-            [
+        buttons = []
+        for ext in source_paths(item):
+            row = [
                 InlineKeyboardButton(
                     f"Get {ext.upper()}",
                     callback_data=f"getfile:{item_id}:{ext}",
                 )
             ]
-            for ext in item["source"]["path"]
-        ]
+            file_path = source_file(item, ext)
+            if file_path and can_preview(file_path):
+                # Start rendering now; it is usually ready before the click
+                PREVIEWS.request(file_path)
+                row.append(
+                    InlineKeyboardButton(
+                        "👁 Preview",
+                        callback_data=f"preview:{item_id}:{ext}",
+                    )
+                )
+            buttons.append(row)
+
+        module = module_of(item)
+        if module:
+            semester, subject, mod = module
+            buttons.append([
+                InlineKeyboardButton(
+                    "Get all module files (ZIP)",
+                    callback_data=f"bundle:{semester}:{subject}:{mod}",
+                )
+            ])
 
         await query.edit_message_reply_markup(
             InlineKeyboardMarkup(buttons)
         )
         return
 
+    # ------------------------------------------------------------
+    # Preview stage:
+    #    User wants a look at a file before downloading it
+    # ------------------------------------------------------------
+    if data.startswith("preview:"):
+        _, item_id, ext = data.split(":", 2)
+        item = kb.by_id.get(item_id)
+        file_path = source_file(item, ext)
+        if not file_path:
+            await query.answer("File not found.")
+            return
+
+        await query.answer("Preparing preview… 👁")
+        try:
+            preview = await PREVIEWS.get(file_path, PREVIEW_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await query.message.reply_text(
+                "⏳ The preview is still being prepared. Please try again in a moment."
+            )
+            return
+        except Exception:
+            LOGGER.exception("Preview of %s failed", file_path)
+            preview = None
+
+        name = item["source"].get("name") or file_path.name
+        markup = download_markup(item_id, ext)
+
+        if preview is None:
+            await query.message.reply_text(
+                f"😕 No preview is available for {name}.", reply_markup=markup
+            )
+        elif preview.kind == "image":
+            with preview.path.open("rb") as f:
+                await query.message.reply_photo(
+                    photo=f, caption=f"👁 First page of {name}", reply_markup=markup
+                )
+        else:
+            await query.message.reply_text(
+                f"👁 Preview of {name}:\n\n{preview.text()}", reply_markup=markup
+            )
+        return
+
+    # ------------------------------------------------------------
+    # Related stage:
+    #    User clicked a "Related" button → answer that entry directly
+    # ------------------------------------------------------------
+    if data.startswith("rel:"):
+        item = kb.by_id.get(data.split(":", 1)[1])
+        if item is None:
+            # Entry no longer exists in the live index version
+            await query.answer("That entry is no longer available.")
+            return
+
+        await query.answer()
+        # Follow-ups now refer to this entry
+        remember_answer(
+            query.message.chat_id, kb, item["_concept_embedding"], [], item
+        )
+        await send_chunks(
+            query.message,
+            split_text(f"❓ {item['question']}\n\n{rendered(item)}"),
+            reply_markup=answer_markup(item),
+        )
+        return
+
+    # ------------------------------------------------------------
+    # Bundle stage:
+    #    User asked for every source file of the entry's module
+    # ------------------------------------------------------------
+    if data.startswith("bundle:"):
+        _, semester, subject, mod = data.split(":", 3)
+        await query.answer("Preparing bundle… 📦")
+
+        error = await send_bundle(
+            context, kb, query.message.chat_id, semester, subject, mod
+        )
+        if error:
+            await query.message.reply_text(error)
+        return
+
     # ------------------------------------------------------------
     # 3. File delivery stage:
     #    User selected a specific source file to download
     # ------------------------------------------------------------
     if data.startswith("getfile:"):
         _, item_id, ext = data.split(":", 2)
-        item = next(it for it in KB if it["id"] == item_id)
+        item = kb.by_id.get(item_id)
 
-        # Resolve file path safely relative to NOTES_DIR
-        file_path = NOTES_DIR / item["source"]["path"][ext].lstrip("/")
+        # Resolve file path safely inside Notes/
+        file_path = source_file(item, ext)
 
         # --------------------------------------------------------
         # 4. Validate file existence before sending
         # --------------------------------------------------------
-        if not file_path.exists():
+        if not file_path:
             await query.answer("File not found.")
             return
 
@@ -411,12 +873,184 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await context.bot.send_document(
             chat_id=query.message.chat_id,
             document=file_path.open("rb"),
-            filename=file_path.name,
+            filename=item["source"].get("name") or file_path.name,
         )
 
         await query.answer("File sent 📎")
 
 
+async def send_bundle(context, kb: LoadedKB, chat_id, semester, subject, module):
+    """
+    Build (or reuse) the ZIP of a module's source files and send it.
+    Returns an error message for the user, or None on success.
+    """
+    def prepare():
+        files = module_files(kb.items, semester, subject, module)
+        return build_bundle(files) if files else None
+
+    try:
+        path = await asyncio.to_thread(prepare)
+    except (KeyError, ValueError):
+        return "😕 I couldn’t understand that semester/module."
+
+    if path is None:
+        return "😕 No source files are attached to that module yet."
+
+    if path.stat().st_size > MAX_UPLOAD_BYTES:
+        return "📦 That bundle is larger than Telegram allows (50 MB)."
+
+    with path.open("rb") as f:
+        await context.bot.send_document(
+            chat_id=chat_id,
+            document=f,
+            filename=bundle_name(semester, subject, module),
+        )
+    return None
+
+
+async def bundle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # ------------------------------------------------------------
+    # /bundle <semester> <subject> <module>
+    # e.g. /bundle 3 DS 1   or   /bundle III DBMS P
+    # ------------------------------------------------------------
+    if not update.message:
+        return
+
+    kb = await kb_for_chat(update.message.chat_id)
+
+    if len(context.args) != 3:
+        await update.message.reply_text(
+            "Usage: /bundle <semester> <subject> <module>\n"
+            "e.g. /bundle 3 DS 1  (use P for practicals)"
+        )
+        return
+
+    semester, subject, module = context.args
+    await update.message.reply_text("📦 Preparing the module bundle…")
+
+    error = await send_bundle(
+        context, kb, update.message.chat_id, semester, subject, module
+    )
+    if error:
+        await update.message.reply_text(error)
+
+
+async def select_kb(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # ------------------------------------------------------------
+    # /kb            → list knowledge bases (current one marked)
+    # /kb <name>     → answer this chat from that knowledge base
+    # ------------------------------------------------------------
+    if not update.message:
+        return
+
+    chat_id = update.message.chat_id
+    current = CHAT_KBS.get(chat_id, DEFAULT_KB)
+    available = index_store.list_kbs()
+
+    if not context.args:
+        lines = [
+            f"{'👉' if name == current else '•'} {name}"
+            for name in available
+        ]
+        await update.message.reply_text(
+            "📚 Knowledge bases:\n\n" + "\n".join(lines)
+            + "\n\nSwitch with /kb <name>"
+        )
+        return
+
+    name = context.args[0]
+    if name not in available:
+        await update.message.reply_text(f"😕 There is no knowledge base called “{name}”.")
+        return
+
+    CHAT_KBS.set(chat_id, None if name == DEFAULT_KB else name)
+
+    kb = await KBS.get_async(name)
+    await update.message.reply_text(
+        f"✅ Now answering from “{name}” ({len(kb.items)} entries)."
+    )
+
+
+# user id -> id of that user's latest inline query
+LATEST_INLINE_QUERY = {}
+
+
+def inline_article(item) -> InlineQueryResultArticle:
+    """Suggestion that posts the question and its answer when picked."""
+    answer = rendered(item)
+    text = split_text(f"❓ {item['question']}\n\n{answer}")[0]
+    return InlineQueryResultArticle(
+        id=item["id"],
+        title=item["question"],
+        description=answer[:100],
+        input_message_content=InputTextMessageContent(text),
+    )
+
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # ------------------------------------------------------------
+    # Inline autocomplete: lexical suggestions first (no model call);
+    # semantic search only if they are weak and the user has paused.
+    # ------------------------------------------------------------
+    inline = update.inline_query
+    if not inline:
+        return
+
+    deadline = Deadline(QUERY_BUDGET_SECONDS)
+
+    # Inline queries carry no chat: use the user's private-chat selection
+    kb = await kb_for_chat(inline.from_user.id)
+
+    text = inline.query
+    if len(text.strip()) < 2:
+        await inline.answer([], cache_time=INLINE_CACHE_SECONDS)
+        return
+
+    user_id = inline.from_user.id
+    LATEST_INLINE_QUERY[user_id] = inline.id
+
+    results = kb.suggestions.search(text, INLINE_RESULTS)
+
+    weak = not results or results[0][0] < INLINE_MIN_LEXICAL_SCORE
+    if weak:
+        await asyncio.sleep(INLINE_PAUSE_SECONDS)
+        if LATEST_INLINE_QUERY.get(user_id) != inline.id:
+            # User kept typing; the newer query will be answered instead
+            return
+
+    # The semantic fallback costs an encode, so it is gated, rate limited
+    # and bounded by what is left of the query budget after the pause
+    query_embedding = None
+    if (
+        weak
+        and deadline.remaining()
+        and query_gate(text, kb.vocabulary, kb.suggestions.fuzzy_words) is None
+        and rate_limit(user_id, None) is None
+    ):
+        query_embedding = await encode_within(text, deadline.remaining())
+
+    if query_embedding is not None:
+        scores, indices = semantic_search(kb, query_embedding, TOP_K_RESULTS)
+        semantic = [
+            (float(s), kb.items[i]) for s, i in zip(scores, indices)
+            if i >= 0 and s >= DEFAULT_THRESHOLDS.min_merge_score
+        ]
+        results = semantic + results
+
+    if LATEST_INLINE_QUERY.get(user_id) == inline.id:
+        del LATEST_INLINE_QUERY[user_id]
+
+    # Result ids must be unique within one answer, and KB ids are not
+    # guaranteed to be (duplicates are only a validation warning)
+    articles, seen = [], set()
+    for _, item in results:
+        if item["id"] not in seen and len(articles) < INLINE_RESULTS:
+            seen.add(item["id"])
+            articles.append(inline_article(item))
+
+    await inline.answer(articles, cache_time=INLINE_CACHE_SECONDS)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # ------------------------------------------------------------
     # Entry greeting for first-time or returning users
@@ -467,17 +1101,155 @@ async def admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "⏱ Auto-closes after inactivity."
     )
 
+# ----------------------------
+# On-demand profiling (admin)
+# ----------------------------
+
+PROFILE = None          # active ProfileSession, if any
+PROFILE_CHAT = None     # chat that receives its report
+
+
+def parse_profile_args(args):
+    """
+    /profile            → next PROFILE_DEFAULT_QUERIES queries
+    /profile 50         → next 50 queries
+    /profile 30s        → next 30 seconds
+    Returns (max_queries, max_seconds).
+    """
+    if not args:
+        return PROFILE_DEFAULT_QUERIES, PROFILE_MAX_SECONDS
+
+    value = args[0].lower()
+    if value.endswith("s"):
+        max_queries, max_seconds = float("inf"), min(float(value[:-1]), PROFILE_MAX_SECONDS)
+    else:
+        max_queries, max_seconds = int(value), PROFILE_MAX_SECONDS
+
+    if max_queries <= 0 or max_seconds <= 0:
+        raise ValueError(value)
+    return max_queries, max_seconds
+
+
+async def finish_profile(bot, session=None):
+    """Stop the active session (or only `session`, if given) and send its report."""
+    global PROFILE
+    if PROFILE is None or session not in (None, PROFILE):
+        return
+    session, chat_id = PROFILE, PROFILE_CHAT
+
+    PROFILE = None
+    session.stop()
+
+    await bot.send_message(chat_id, session.summary())
+    report = io.BytesIO(session.full_report().encode("utf-8"))
+    await bot.send_document(chat_id, document=report, filename="profile.txt")
+
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # ------------------------------------------------------------
+    # /profile [N | Ts | stop]  (admins only)
+    # ------------------------------------------------------------
+    global PROFILE, PROFILE_CHAT
+
+    user = update.effective_user
+    if not user or not is_admin(user.id):
+        await update.message.reply_text("⛔ You are not authorized.")
+        return
+
+    if context.args and context.args[0].lower() == "stop":
+        if PROFILE is None:
+            await update.message.reply_text("No profiling session is running.")
+        await finish_profile(context.bot)
+        return
+
+    if PROFILE is not None:
+        await update.message.reply_text(
+            "🔬 A profiling session is already running (/profile stop ends it)."
+        )
+        return
+
+    try:
+        max_queries, max_seconds = parse_profile_args(context.args)
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [queries | <seconds>s | stop]")
+        return
+
+    session = PROFILE = ProfileSession(max_queries, max_seconds)
+    PROFILE_CHAT = update.message.chat_id
+
+    # End on time even if no queries arrive
+    loop = asyncio.get_running_loop()
+    loop.call_later(
+        max_seconds,
+        lambda: loop.create_task(finish_profile(context.bot, session)),
+    )
+
+    limit = (
+        f"the next {max_queries} queries or {max_seconds:g}s"
+        if max_queries != float("inf") else f"the next {max_seconds:g}s"
+    )
+    await update.message.reply_text(f"🔬 Profiling {limit}…")
+
+
+async def metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # ------------------------------------------------------------
+    # /metrics  (admins only): latency and degraded answers so far
+    # ------------------------------------------------------------
+    user = update.effective_user
+    if not user or not is_admin(user.id):
+        await update.message.reply_text("⛔ You are not authorized.")
+        return
+
+    await update.message.reply_text(
+        f"{METRICS.report()}\n"
+        f"Query cache: {len(QUERY_CACHE)} embeddings, "
+        f"{100 * QUERY_CACHE.hit_rate():.0f}% hits "
+        f"({QUERY_CACHE.hits} hits · {QUERY_CACHE.misses} encodes)\n"
+        f"Budget: {1000 * QUERY_BUDGET_SECONDS:.0f} ms per query"
+    )
+
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Text message entry point: answer it, and count it for /metrics and /profile."""
+    deadline = Deadline(QUERY_BUDGET_SECONDS)
+    try:
+        await handle_query(update, context, deadline)
+    finally:
+        METRICS.record(deadline)
+        if PROFILE is not None and PROFILE.query_done():
+            await finish_profile(context.bot)
+
 # ============================================================
 # Entrypoint
 # ============================================================
 
-if __name__ == "__main__":
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+def build_application(concurrent_updates: bool = False):
+    """
+    Build the Telegram application with all handlers registered.
+    Used by polling mode below and by webhook_server.py workers.
+    """
+    builder = ApplicationBuilder().token(BOT_TOKEN)
+    builder = builder.concurrent_updates(concurrent_updates)
+    if TELEGRAM_API_BASE_URL:
+        # Point at a local Bot API stand-in (testing / load tests)
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", start))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_query))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(CallbackQueryHandler(handle_callback))
+    app.add_handler(InlineQueryHandler(handle_inline_query))
     app.add_handler(CommandHandler("admin", admin))
+    app.add_handler(CommandHandler("bundle", bundle))
+    app.add_handler(CommandHandler("kb", select_kb))
+    app.add_handler(CommandHandler("profile", profile))
+    app.add_handler(CommandHandler("metrics", metrics))
+
+    return app
+
+
+if __name__ == "__main__":
+    app = build_application()
 
     print("Bot running... just message it anything!")
     app.run_polling()
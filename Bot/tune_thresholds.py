@@ -0,0 +1,405 @@
+"""
+Offline threshold tuning for the bot's answer decision logic.
+
+Given a labelled query set, this script searches the decision constants in
+decision.py (MIN_MERGE_SCORE, DOMINANCE_MARGIN, CONCEPT_SIM_THRESHOLD,
+MIN_COMMON_TAGS and CONFIDENCE_LEVELS) for the configuration that answers
+most precisely while still answering at least a target share of queries.
+
+Labelled set format (JSON list):
+
+    [
+      {"query": "What is a stack?", "expected": ["S3_DS_M2_001"]},
+      {"query": "Who won the match?", "expected": []}
+    ]
+
+"expected" lists every KB id that is an acceptable answer. An empty list
+means the bot should decline. A reply counts as correct only if every
+entry shown to the user is acceptable (single answer or merged answer).
+
+Query and question embeddings are cached on disk keyed by model name and
+text, so after the first run each sweep only does numpy work: every
+configuration is evaluated over the whole labelled set at once.
+
+Usage (from the repository root):
+
+    python Bot/tune_thresholds.py labels.json --coverage 0.7
+    python Bot/tune_thresholds.py labels.json --search random --trials 5000
+"""
+
+from pathlib import Path
+import argparse
+import hashlib
+import itertools
+import json
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from decision import (
+    COMBO_KEYWORDS,
+    DEFAULT_THRESHOLDS,
+    Thresholds,
+    confidence_from_score,
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import index_store  # noqa: E402
+
+# ============================================================
+# Configuration
+# ============================================================
+
+DATA_DIR = Path("./Data")
+CACHE_PATH = DATA_DIR / ".tuning_embeddings.npz"
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+TOP_K_RESULTS = 5
+
+# Search space (inclusive ranges)
+GRID = {
+    "min_merge_score": np.arange(0.40, 0.751, 0.025),
+    "dominance_margin": np.arange(0.00, 0.301, 0.02),
+    "concept_sim_threshold": np.arange(0.40, 0.801, 0.025),
+    "min_common_tags": np.arange(0, 5),
+}
+
+# Target precision per confidence label when calibrating CONFIDENCE_LEVELS
+CONFIDENCE_TARGETS = (
+    ("high", 0.90),
+    ("medium", 0.75),
+    ("low", 0.50),
+)
+
+
+# ============================================================
+# Embedding cache
+# ============================================================
+
+def _cache_key(text: str) -> str:
+    return hashlib.sha1(f"{MODEL_NAME}\0{text}".encode("utf-8")).hexdigest()
+
+
+def load_embedding_cache(path: Path) -> dict:
+    """Load {key: embedding} from an .npz cache (empty if missing)."""
+    if not path.exists():
+        return {}
+    data = np.load(path)
+    return dict(zip(data["keys"].tolist(), data["vectors"]))
+
+
+def save_embedding_cache(path: Path, cache: dict) -> None:
+    keys = list(cache)
+    vectors = np.stack([cache[k] for k in keys]).astype(np.float32)
+    # np.savez appends ".npz" unless the name already ends with it
+    tmp = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp, keys=np.array(keys), vectors=vectors)
+    tmp.replace(path)
+
+
+def embed_texts(texts, cache: dict) -> np.ndarray:
+    """
+    Return normalized embeddings for texts, encoding only cache misses.
+    The model is loaded lazily so fully cached runs never touch it.
+    """
+    keys = [_cache_key(t) for t in texts]
+    missing = sorted({t for t, k in zip(texts, keys) if k not in cache})
+
+    if missing:
+        from sentence_transformers import SentenceTransformer
+
+        print(f"🧠 Encoding {len(missing)} uncached texts...")
+        model = SentenceTransformer(MODEL_NAME)
+        vectors = model.encode(
+            missing,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=True
+        )
+        for text, vec in zip(missing, vectors):
+            cache[_cache_key(text)] = vec.astype(np.float32)
+
+    return np.stack([cache[k] for k in keys])
+
+
+# ============================================================
+# Feature extraction (threshold independent)
+# ============================================================
+
+def extract_features(labels, kb, index, cache: dict) -> dict:
+    """
+    Run the threshold-independent part of the pipeline once per query.
+
+    Returns (Q = queries, K = TOP_K_RESULTS):
+    - scores  (Q, K) search scores, strongest-first (-inf for padding)
+    - concept (Q, K) query · question-embedding similarity
+    - overlap (Q, K) tag overlap with the top candidate
+    - combo   (Q,)   combo-query flag
+    - correct (Q, K) candidate is an acceptable answer
+    - expects (Q,)   query has at least one acceptable answer
+    """
+    queries = [row["query"].strip() for row in labels]
+    query_vecs = embed_texts(queries, cache)
+
+    scores, indices = index.search(query_vecs, TOP_K_RESULTS)
+    valid = indices >= 0
+    scores = np.where(valid, scores, -np.inf).astype(np.float32)
+
+    # Concept embeddings only for KB entries that ever appear as candidates
+    used = sorted(set(indices[valid].tolist()))
+    question_vecs = embed_texts([kb[i]["question"] for i in used], cache)
+    row_of = {kb_idx: row for row, kb_idx in enumerate(used)}
+
+    q, k = indices.shape
+    concept = np.full((q, k), -np.inf, dtype=np.float32)
+    overlap = np.zeros((q, k), dtype=np.int32)
+    correct = np.zeros((q, k), dtype=bool)
+
+    for qi in range(q):
+        expected = set(labels[qi].get("expected") or [])
+        top_tags = set(kb[indices[qi, 0]].get("tags", [])) if valid[qi, 0] else set()
+
+        for ki in range(k):
+            if not valid[qi, ki]:
+                continue
+            item = kb[indices[qi, ki]]
+            concept[qi, ki] = float(
+                np.dot(query_vecs[qi], question_vecs[row_of[indices[qi, ki]]])
+            )
+            overlap[qi, ki] = len(top_tags & set(item.get("tags", [])))
+            correct[qi, ki] = item["id"] in expected
+
+    combo = np.array(
+        [any(w in text.lower() for w in COMBO_KEYWORDS) for text in queries]
+    )
+    expects = np.array([bool(row.get("expected")) for row in labels])
+
+    return {
+        "scores": scores,
+        "concept": concept,
+        "overlap": overlap,
+        "combo": combo,
+        "correct": correct,
+        "expects": expects,
+    }
+
+
+# ============================================================
+# Vectorized evaluation of decision.decide()
+# ============================================================
+
+def evaluate(features: dict, th: Thresholds) -> dict:
+    """
+    Evaluate one threshold configuration over all queries at once.
+    Mirrors decision.decide() exactly (candidates are already sorted).
+    """
+    scores = features["scores"]
+    rows = np.arange(scores.shape[0])
+
+    relevant = scores >= th.min_merge_score
+    keep = relevant & (
+        (features["concept"] >= th.concept_sim_threshold)
+        | features["combo"][:, None]
+        | (features["overlap"] >= th.min_common_tags)
+    )
+
+    count = keep.sum(axis=1)
+    answered = count > 0
+
+    first = np.argmax(keep, axis=1)
+    rest = keep.copy()
+    rest[rows, first] = False
+    second = np.argmax(rest, axis=1)
+
+    best = np.where(answered, scores[rows, first], 0.0)
+    runner_up = np.where(count > 1, scores[rows, second], 0.0)
+    single = answered & (
+        (count == 1) | ((best - runner_up) >= th.dominance_margin)
+    )
+    merged = answered & ~single
+
+    correct_all = np.all(features["correct"] | ~keep, axis=1)
+    correct = np.where(
+        single,
+        features["correct"][rows, first],
+        merged & correct_all
+    )
+
+    n_answered = int(answered.sum())
+    total = len(scores)
+    declined_ok = int((~answered & ~features["expects"]).sum())
+
+    return {
+        "precision": (int(correct.sum()) / n_answered) if n_answered else 0.0,
+        "coverage": n_answered / total if total else 0.0,
+        "accuracy": (int(correct.sum()) + declined_ok) / total if total else 0.0,
+        "merge_rate": (int(merged.sum()) / n_answered) if n_answered else 0.0,
+        "best": best,
+        "answered": answered,
+        "correct": correct,
+    }
+
+
+def better(a: dict, b: dict, min_coverage: float) -> bool:
+    """True if result a beats b (precision at coverage, then coverage)."""
+    a_ok = a["coverage"] >= min_coverage
+    b_ok = b["coverage"] >= min_coverage
+    if a_ok != b_ok:
+        return a_ok
+    if not a_ok:
+        return a["coverage"] > b["coverage"]
+    return (a["precision"], a["coverage"]) > (b["precision"], b["coverage"])
+
+
+# ============================================================
+# Search strategies
+# ============================================================
+
+def grid_configs():
+    for mms, dm, cst, mct in itertools.product(
+        GRID["min_merge_score"],
+        GRID["dominance_margin"],
+        GRID["concept_sim_threshold"],
+        GRID["min_common_tags"],
+    ):
+        yield Thresholds(
+            min_merge_score=round(float(mms), 4),
+            confidence_levels=DEFAULT_THRESHOLDS.confidence_levels,
+            dominance_margin=round(float(dm), 4),
+            concept_sim_threshold=round(float(cst), 4),
+            min_common_tags=int(mct),
+        )
+
+
+def random_configs(trials: int, seed: int):
+    rng = np.random.default_rng(seed)
+    span = {k: (float(v.min()), float(v.max())) for k, v in GRID.items()}
+
+    for _ in range(trials):
+        yield Thresholds(
+            min_merge_score=round(rng.uniform(*span["min_merge_score"]), 4),
+            confidence_levels=DEFAULT_THRESHOLDS.confidence_levels,
+            dominance_margin=round(rng.uniform(*span["dominance_margin"]), 4),
+            concept_sim_threshold=round(
+                rng.uniform(*span["concept_sim_threshold"]), 4
+            ),
+            min_common_tags=int(rng.integers(
+                span["min_common_tags"][0], span["min_common_tags"][1] + 1
+            )),
+        )
+
+
+def calibrate_confidence_levels(result: dict, floor: float) -> tuple:
+    """
+    Pick the lowest best-score cutoff per label whose answers reach the
+    target precision. Labels that never reach it keep the default cutoff.
+    """
+    best = result["best"][result["answered"]]
+    correct = result["correct"][result["answered"]]
+    defaults = dict((lvl, th) for th, lvl in DEFAULT_THRESHOLDS.confidence_levels)
+
+    levels = []
+    previous = np.inf
+    for label, target in CONFIDENCE_TARGETS:
+        cutoff = defaults[label]
+        for candidate in np.sort(np.unique(best)):
+            if candidate < floor or candidate >= previous:
+                continue
+            mask = best >= candidate
+            if correct[mask].mean() >= target:
+                cutoff = round(float(candidate), 3)
+                break
+        cutoff = min(cutoff, previous)
+        levels.append((cutoff, label))
+        previous = cutoff
+
+    return tuple(levels)
+
+
+# ============================================================
+# Entrypoint
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("labels", type=Path, help="labelled query set (JSON)")
+    parser.add_argument("--coverage", type=float, default=0.6,
+                        help="minimum share of queries that must be answered")
+    parser.add_argument("--search", choices=("grid", "random"), default="grid")
+    parser.add_argument("--trials", type=int, default=2000,
+                        help="configurations to sample for --search random")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    labels = json.loads(args.labels.read_text(encoding="utf-8"))
+    manifest = index_store.load_manifest()
+    kb = json.loads(manifest["_paths"]["meta"].read_text(encoding="utf-8"))
+    index = faiss.read_index(str(manifest["_paths"]["index"]))
+
+    cache = load_embedding_cache(CACHE_PATH)
+    cached_before = len(cache)
+    features = extract_features(labels, kb, index, cache)
+    if len(cache) != cached_before:
+        save_embedding_cache(CACHE_PATH, cache)
+
+    print(
+        f"📚 {len(labels)} labelled queries, {len(kb)} KB entries "
+        f"(index version {manifest['version']})"
+    )
+
+    baseline = evaluate(features, DEFAULT_THRESHOLDS)
+    configs = (
+        grid_configs() if args.search == "grid"
+        else random_configs(args.trials, args.seed)
+    )
+
+    started = time.perf_counter()
+    best_th, best_res, evaluated = DEFAULT_THRESHOLDS, baseline, 0
+    for th in configs:
+        res = evaluate(features, th)
+        evaluated += 1
+        if better(res, best_res, args.coverage):
+            best_th, best_res = th, res
+    elapsed = time.perf_counter() - started
+
+    levels = calibrate_confidence_levels(best_res, best_th.min_merge_score)
+
+    def summary(res):
+        return (
+            f"precision={res['precision']:.3f} coverage={res['coverage']:.3f} "
+            f"accuracy={res['accuracy']:.3f} merge_rate={res['merge_rate']:.3f}"
+        )
+
+    print(f"⏱  Evaluated {evaluated} configurations in {elapsed:.2f}s")
+    print(f"📉 Current : {summary(baseline)}")
+    print(f"📈 Best    : {summary(best_res)}")
+    if best_res["coverage"] < args.coverage:
+        print(f"⚠️  No configuration reached coverage {args.coverage:.2f}")
+
+    print("\nSuggested constants for Bot/decision.py:\n")
+    print(f"MIN_MERGE_SCORE = {best_th.min_merge_score}")
+    print("CONFIDENCE_LEVELS = (")
+    for cutoff, label in levels:
+        print(f'    ({cutoff}, "{label}"),')
+    print(")")
+    print(f"DOMINANCE_MARGIN = {best_th.dominance_margin}")
+    print(f"MIN_COMMON_TAGS = {best_th.min_common_tags}")
+    print(f"CONCEPT_SIM_THRESHOLD = {best_th.concept_sim_threshold}")
+
+    print("\nAnswers per confidence label (suggested levels):")
+    for cutoff, label in levels:
+        answered = best_res["answered"]
+        mask = answered & (
+            np.array([confidence_from_score(s, levels) for s in best_res["best"]])
+            == label
+        )
+        n = int(mask.sum())
+        precision = best_res["correct"][mask].mean() if n else 0.0
+        print(f"  {label:<7} n={n:<4} precision={precision:.3f}")
+
+
+if __name__ == "__main__":
+    main()
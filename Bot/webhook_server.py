@@ -0,0 +1,231 @@
+"""
+Webhook serving mode for the Telegram bot, with multiple worker processes.
+
+Polling (telegram_bot.py) runs everything in one process. In webhook mode:
+
+- a front process receives Telegram webhook POSTs on WEBHOOK_PATH and
+  answers 200 immediately;
+- each update is routed to one of N worker processes by chat id, so all
+  updates of a chat are handled by the same worker, in arrival order;
+- inside a worker, different chats are handled concurrently while each
+  chat's updates stay sequential.
+
+The embedding model and index are loaded once, in the front process,
+before the workers are forked: model weights are shared copy-on-write and
+the index is memory-mapped (see INDEX_IO_FLAGS in telegram_bot.py).
+Platforms without fork() fall back to spawn, where each worker loads its
+own copy.
+
+Usage (from the repository root):
+
+    WEBHOOK_URL=https://<public-host>/webhook python Bot/webhook_server.py --workers 4
+
+Set TELEGRAM_API_BASE_URL to point the workers (and setWebhook) at a local
+Bot API stand-in; leave WEBHOOK_URL unset to skip webhook registration.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import urllib.request
+
+from telegram import Update
+
+import telegram_bot
+from telegram_bot import LOGGER
+
+# ============================================================
+# Configuration
+# ============================================================
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")          # public URL Telegram posts to
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")    # X-Telegram-Bot-Api-Secret-Token
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Update fields that carry a chat (or at least a user) to route by
+_ROUTED_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "callback_query", "inline_query", "chosen_inline_result",
+    "my_chat_member", "chat_member", "chat_join_request",
+)
+
+
+# ============================================================
+# Routing
+# ============================================================
+
+def chat_key(data: dict) -> int:
+    """
+    Routing key of a raw update: the chat id when there is one, else the
+    sender's user id, else the update id.
+    """
+    for field in _ROUTED_FIELDS:
+        obj = data.get(field)
+        if not obj:
+            continue
+        chat = obj.get("chat") or (obj.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+        sender = obj.get("from")
+        if sender and "id" in sender:
+            return int(sender["id"])
+    return int(data.get("update_id", 0))
+
+
+# ============================================================
+# Worker process
+# ============================================================
+
+async def _serve_updates(queue):
+    app = telegram_bot.build_application(concurrent_updates=True)
+    loop = asyncio.get_running_loop()
+    chat_queues = {}
+
+    async def drain_chat(key, pending: asyncio.Queue):
+        while True:
+            update = await pending.get()
+            try:
+                await app.process_update(update)
+            except Exception:
+                LOGGER.exception("Failed to process update %s", update.update_id)
+            if pending.empty():
+                # No await between the check and the pop, so no update
+                # can slip in unnoticed.
+                chat_queues.pop(key, None)
+                return
+
+    tasks = set()
+    async with app:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+
+            data = json.loads(raw)
+            key = chat_key(data)
+            update = Update.de_json(data, app.bot)
+
+            pending = chat_queues.get(key)
+            if pending is None:
+                pending = chat_queues[key] = asyncio.Queue()
+                task = asyncio.create_task(drain_chat(key, pending))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            pending.put_nowait(update)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def run_worker(worker_id: int, queue, threads: int):
+    """Entry point of one worker process."""
+    import torch
+
+    # Avoid N workers each spinning up one thread per core
+    torch.set_num_threads(threads)
+    LOGGER.info("Worker %d started (pid %d, %d threads)", worker_id, os.getpid(), threads)
+    asyncio.run(_serve_updates(queue))
+
+
+# ============================================================
+# Front process (webhook receiver)
+# ============================================================
+
+def make_handler(queues):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != WEBHOOK_PATH:
+                self.send_error(404)
+                return
+
+            if WEBHOOK_SECRET and (
+                self.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET
+            ):
+                self.send_error(403)
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            try:
+                key = chat_key(json.loads(raw))
+            except (ValueError, TypeError):
+                self.send_error(400)
+                return
+
+            queues[key % len(queues)].put(raw.decode("utf-8"))
+
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            LOGGER.debug("webhook: " + format, *args)
+
+    return WebhookHandler
+
+
+def register_webhook():
+    """Tell the Bot API (real or local stand-in) where to post updates."""
+    base = telegram_bot.TELEGRAM_API_BASE_URL or "https://api.telegram.org/bot"
+    payload = {"url": WEBHOOK_URL, "drop_pending_updates": False}
+    if WEBHOOK_SECRET:
+        payload["secret_token"] = WEBHOOK_SECRET
+
+    request = urllib.request.Request(
+        f"{base}{telegram_bot.BOT_TOKEN}/setWebhook",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        LOGGER.info("setWebhook: %s", response.read().decode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot in webhook mode")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    args = parser.parse_args()
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    queues = [ctx.Queue() for _ in range(args.workers)]
+    workers = [
+        ctx.Process(target=run_worker, args=(i, q, threads), daemon=True)
+        for i, q in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+
+    if WEBHOOK_URL:
+        register_webhook()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(queues))
+    print(
+        f"Webhook front listening on http://{args.host}:{args.port}{WEBHOOK_PATH} "
+        f"with {args.workers} workers"
+    )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for q in queues:
+            q.put(None)
+        for worker in workers:
+            worker.join(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
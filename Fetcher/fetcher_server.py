@@ -1,31 +1,178 @@
 from flask import Flask, send_file, request, abort
 import json
+import os
+import sys
+import threading
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import index_store  # noqa: E402
+from source_files import (  # noqa: E402
+    build_bundle,
+    bundle_name,
+    file_digest,
+    module_files,
+    resolve_source,
+    source_paths,
+)
+
 app = Flask(__name__)
 
 DATA_DIR = Path("./Data")
-KB = json.loads((DATA_DIR / "meta.json").read_text())
-NOTES_DIR = Path("./Notes")
+
+PORT = 8001
+SERVER_THREADS = 16          # worker threads when served by waitress
+CACHE_MAX_AGE = 3600         # seconds clients may reuse a file without asking
+
+
+# ============================================================
+# File table: (id, ext) -> resolved path, size, mtime, etag
+# ============================================================
+
+_TABLE_LOCK = threading.Lock()
+
+
+def file_entry(file_path: Path):
+    """Stat + hash a file (the hash is reused while size/mtime are unchanged)."""
+    try:
+        st = file_path.stat()
+    except OSError:
+        return None
+
+    return {
+        "path": file_path,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "etag": file_digest(file_path, st),
+    }
+
+
+def build_file_table(kb):
+    table = {}
+    for item in kb:
+        for ext, rel_path in source_paths(item).items():
+            file_path = resolve_source(rel_path)
+            entry = file_entry(file_path) if file_path else None
+            if entry:
+                entry["name"] = item["source"].get("name") or file_path.name
+                table[(item["id"], ext)] = entry
+    return table
+
+
+def load_table(manifest):
+    kb = json.loads(manifest["_paths"]["meta"].read_text(encoding="utf-8"))
+    return kb, build_file_table(kb)
+
+
+MANIFEST = index_store.load_manifest()
+KB, FILES = load_table(MANIFEST)
+
+
+def reload_table_if_changed():
+    """Rebuild the file table when a new index version has been published."""
+    global MANIFEST, KB, FILES
+
+    version = index_store.current_version()
+    if version is None or version == MANIFEST["version"]:
+        return
+
+    with _TABLE_LOCK:
+        if version == MANIFEST["version"]:
+            return
+        manifest = index_store.load_manifest(version)
+        KB, FILES = load_table(manifest)
+        MANIFEST = manifest
+
+
+def current_entry(item_id, ext):
+    """
+    Look up a file, re-hashing it only if it changed on disk since the
+    table was built (a single stat per request).
+    """
+    entry = FILES.get((item_id, ext))
+    if entry is None:
+        return None
+
+    try:
+        st = os.stat(entry["path"])
+    except OSError:
+        return None
+
+    if (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+        entry = file_entry(entry["path"])
+        if entry:
+            entry["name"] = FILES[(item_id, ext)]["name"]
+            FILES[(item_id, ext)] = entry
+
+    return entry
+
+
+# ============================================================
+# Routes
+# ============================================================
 
 @app.get("/fetch")
 def fetch():
+    reload_table_if_changed()
+
     item_id = request.args.get("id")
     ext = request.args.get("ext")
 
-    item = next((i for i in KB if i["id"] == item_id), None)
-    if not item:
+    entry = current_entry(item_id, ext)
+    if not entry:
         abort(404)
 
-    path = item["source"]["path"].get(ext)
-    if not path:
-        abort(404)
+    # conditional=True makes Werkzeug answer If-None-Match /
+    # If-Modified-Since with 304 and Range requests with 206.
+    return send_file(
+        entry["path"],
+        as_attachment=True,
+        download_name=entry["name"],
+        conditional=True,
+        etag=entry["etag"],
+        last_modified=entry["mtime_ns"] / 1e9,
+        max_age=CACHE_MAX_AGE,
+    )
 
-    file_path = NOTES_DIR / path
-    if not file_path.exists():
+
+@app.get("/bundle")
+def bundle():
+    """
+    ZIP of every source file of one module:
+    /bundle?semester=3&subject=DS&module=1   (module=P for practicals)
+    """
+    reload_table_if_changed()
+
+    semester = request.args.get("semester")
+    subject = request.args.get("subject")
+    module = request.args.get("module")
+    if not (semester and subject and module):
+        abort(400)
+
+    try:
+        files = module_files(KB, semester, subject, module)
+    except (KeyError, ValueError):
+        abort(400)
+    if not files:
         abort(404)
 
-    return send_file(file_path, as_attachment=True)
+    path = build_bundle(files)
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=bundle_name(semester, subject, module),
+        conditional=True,
+        etag=path.stem,
+        max_age=CACHE_MAX_AGE,
+    )
+
 
 if __name__ == "__main__":
-    app.run(port=8001)
+    try:
+        from waitress import serve
+    except ImportError:
+        # Werkzeug's threaded dev server: one thread per request
+        app.run(port=PORT, threaded=True)
+    else:
+        serve(app, host="127.0.0.1", port=PORT, threads=SERVER_THREADS)
@@ -0,0 +1,119 @@
+"""
+Near-duplicate detection over the KB embedding matrix.
+
+Entries are grouped into clusters whose pairwise links have cosine
+similarity >= threshold. Links come from a single FAISS range search of
+the (normalized) embedding matrix against itself, so the cost stays with
+FAISS instead of an O(N²) Python loop.
+"""
+
+import faiss
+import numpy as np
+
+DEDUP_THRESHOLD = 0.95
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_duplicate_clusters(embeddings: np.ndarray, threshold: float = DEDUP_THRESHOLD):
+    """
+    Return clusters (lists of row numbers, ascending) of size >= 2.
+    embeddings must already be L2-normalized float32.
+    """
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+
+    # Range search returns every neighbour with similarity > threshold;
+    # nudge the radius down so `>= threshold` pairs are included too.
+    lims, _, neighbours = index.range_search(embeddings, threshold - 1e-6)
+
+    rows = np.repeat(np.arange(len(embeddings)), np.diff(lims).astype(np.int64))
+    pairs = rows < neighbours          # drop self-matches and mirrored pairs
+    rows, neighbours = rows[pairs], neighbours[pairs]
+
+    parent = list(range(len(embeddings)))
+    for a, b in zip(rows.tolist(), neighbours.tolist()):
+        root_a, root_b = _find(parent, a), _find(parent, b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for i in np.unique(np.concatenate([rows, neighbours])).tolist():
+        groups.setdefault(_find(parent, i), []).append(i)
+
+    return sorted(
+        (sorted(members) for members in groups.values() if len(members) > 1),
+        key=lambda members: members[0],
+    )
+
+
+def pick_canonical(kb, members) -> int:
+    """
+    Choose the entry that represents a cluster: the first one (in load
+    order) that has source files attached, else simply the first one.
+    """
+    for i in members:
+        source = kb[i].get("source") or {}
+        if source.get("path"):
+            return i
+    return members[0]
+
+
+def collapse_duplicates(kb, clusters):
+    """
+    Return the row numbers to keep, in load order. Each kept canonical
+    entry records the ids it absorbed under "_duplicates".
+    """
+    dropped = set()
+
+    for members in clusters:
+        canonical = pick_canonical(kb, members)
+        others = [i for i in members if i != canonical]
+        kb[canonical]["_duplicates"] = [kb[i]["id"] for i in others]
+        dropped.update(others)
+
+    return [i for i in range(len(kb)) if i not in dropped]
+
+
+def report_clusters(kb, clusters, limit: int = 20):
+    """Print a short human-readable duplicate report."""
+    if not clusters:
+        print("🧹 No near-duplicate entries found.")
+        return
+
+    extra = sum(len(members) - 1 for members in clusters)
+    print(
+        f"🧹 Found {len(clusters)} near-duplicate clusters "
+        f"({extra} redundant entries):"
+    )
+
+    for members in clusters[:limit]:
+        canonical = pick_canonical(kb, members)
+        print(f"  • {kb[canonical]['id']}: {kb[canonical]['question'][:70]}")
+        for i in members:
+            if i != canonical:
+                print(
+                    f"      ≈ {kb[i]['id']} ({kb[i].get('_source_file', '?')})"
+                )
+
+    if len(clusters) > limit:
+        print(f"  … and {len(clusters) - limit} more (see duplicates.json)")
+
+
+def clusters_as_json(kb, clusters):
+    """Serializable report stored alongside the index version."""
+    return [
+        {
+            "canonical": kb[pick_canonical(kb, members)]["id"],
+            "members": [
+                {"id": kb[i]["id"], "file": kb[i].get("_source_file")}
+                for i in members
+            ],
+        }
+        for members in clusters
+    ]
@@ -0,0 +1,210 @@
+"""
+Validation of knowledge JSON files before an index rebuild.
+
+Every file is checked against the entry format of
+"Data Element Format 30112025.txt" and *all* problems are reported at
+once, with file and entry index, before the embedding model is loaded.
+
+Files are handled one at a time and their entries are decoded and checked
+one at a time (only the ids are kept), so memory stays at one file's text
+plus one entry regardless of the KB size. Results are cached by (size,
+mtime) in the index store (Data/index/validation_cache.json, which no
+knowledge-file scan reads), so a rebuild re-reads only the files that
+changed since the last check.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+
+CACHE_VERSION = 1       # bump when the rules below change
+SOURCE_TYPES = {"file", "url"}
+EXTENSION_RE = re.compile(r"^[A-Za-z0-9]+$")
+JSON_SPACE = re.compile(r"[ \t\n\r]*")
+
+
+# =========================================================
+# Rules
+# =========================================================
+
+def _text_field(entry, key):
+    value = entry.get(key)
+    if value is None:
+        return f"missing {key}"
+    if not isinstance(value, str) or not value.strip():
+        return f"{key} must be a non-empty string"
+    return None
+
+
+def _location_errors(value, key):
+    """source.path / source.url: null, a single string, or {extension: path}."""
+    if value is None or isinstance(value, str):
+        return []
+    if not isinstance(value, dict):
+        return [f"source.{key} must be a string or an {{extension: path}} object"]
+
+    errors = []
+    for ext, target in value.items():
+        if not EXTENSION_RE.match(ext):
+            errors.append(f"source.{key} has an invalid extension key {ext!r}")
+        if not isinstance(target, str) or not target.strip():
+            errors.append(f"source.{key}[{ext!r}] must be a non-empty string")
+    return errors
+
+
+def entry_errors(entry) -> list:
+    """Problems with one entry (empty if it is valid)."""
+    if not isinstance(entry, dict):
+        return ["entry is not an object"]
+
+    errors = [
+        error for error in (_text_field(entry, key) for key in ("id", "question", "answer"))
+        if error
+    ]
+
+    tags = entry.get("tags")
+    if tags is not None and (
+        not isinstance(tags, list) or not all(isinstance(t, str) for t in tags)
+    ):
+        errors.append("tags must be a list of strings")
+
+    source = entry.get("source")
+    if source is None:
+        return errors
+    if not isinstance(source, dict):
+        errors.append("source must be an object")
+        return errors
+
+    if source.get("type") is not None and source["type"] not in SOURCE_TYPES:
+        errors.append(f"source.type must be one of {sorted(SOURCE_TYPES)}")
+    errors += _location_errors(source.get("path"), "path")
+    errors += _location_errors(source.get("url"), "url")
+    return errors
+
+
+def iter_list(text: str):
+    """
+    Decode the elements of a top-level JSON list one at a time.
+    Raises ValueError if the document is not a list and
+    json.JSONDecodeError (with the document position) if it is malformed.
+    """
+    decoder = json.JSONDecoder()
+    pos = _skip_space(text, 0)
+    if not text.startswith("[", pos):
+        json.loads(text)    # malformed JSON reports as such first
+        raise ValueError("not a list")
+
+    pos = _skip_space(text, pos + 1)
+    if text.startswith("]", pos):
+        pos += 1
+    else:
+        while True:
+            entry, pos = decoder.raw_decode(text, pos)
+            yield entry
+
+            pos = _skip_space(text, pos)
+            if text.startswith("]", pos):
+                pos += 1
+                break
+            if not text.startswith(",", pos):
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+            pos = _skip_space(text, pos + 1)
+
+    pos = _skip_space(text, pos)
+    if pos != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+
+
+def _skip_space(text: str, pos: int) -> int:
+    return JSON_SPACE.match(text, pos).end()
+
+
+def check_file(file: Path):
+    """
+    Validate one knowledge JSON file.
+    Returns (["index N: problem", ...], [entry id, ...]).
+    """
+    errors, ids = [], []
+    try:
+        text = file.read_bytes().decode("utf-8")
+        for idx, entry in enumerate(iter_list(text)):
+            errors += [f"index {idx}: {problem}" for problem in entry_errors(entry)]
+            if isinstance(entry, dict) and isinstance(entry.get("id"), str):
+                ids.append(entry["id"])
+    except UnicodeDecodeError as e:
+        return [f"not UTF-8 ({e.reason} at byte {e.start})"], []
+    except json.JSONDecodeError as e:
+        return [f"invalid JSON: {e.msg} (line {e.lineno}, column {e.colno})"], []
+    except ValueError:
+        return ["does not contain a JSON list"], []
+
+    return errors, ids
+
+
+# =========================================================
+# Cached validation of a file set
+# =========================================================
+
+def _load_cache(path: Path) -> dict:
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return cache.get("files", {}) if cache.get("version") == CACHE_VERSION else {}
+
+
+def _save_cache(path: Path, files: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    tmp.write_text(json.dumps({"version": CACHE_VERSION, "files": files}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def validate_files(files, base_dir: Path, cache_path: Path = None):
+    """
+    Validate every file (unchanged ones straight from the cache).
+    Returns (errors, warnings, number of files actually re-read);
+    messages read "<file relative to base_dir>: <problem>".
+    """
+    cached = _load_cache(cache_path) if cache_path else {}
+    results = {}
+    checked = 0
+
+    for file in files:
+        name = file.relative_to(base_dir).as_posix()
+        st = file.stat()
+        stamp = [st.st_size, st.st_mtime_ns]
+
+        result = cached.get(name)
+        if result is None or result["stamp"] != stamp:
+            errors, ids = check_file(file)
+            result = {"stamp": stamp, "errors": errors, "ids": ids}
+            checked += 1
+        results[name] = result
+
+    if cache_path and checked:
+        # Keep results of files outside this set (e.g. a --source subset)
+        others = {
+            name: result for name, result in cached.items()
+            if name not in results and (base_dir / name).exists()
+        }
+        _save_cache(cache_path, others | results)
+
+    errors = [
+        f"{name}: {problem}"
+        for name, result in results.items()
+        for problem in result["errors"]
+    ]
+
+    # The bot looks entries up by id; a duplicate shadows the other entry
+    seen = {}
+    warnings = []
+    for name, result in results.items():
+        for entry_id in result["ids"]:
+            if entry_id in seen:
+                warnings.append(f"{name}: duplicate id {entry_id!r} (also in {seen[entry_id]})")
+            else:
+                seen[entry_id] = name
+
+    return errors, warnings, checked
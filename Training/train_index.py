@@ -1,27 +1,80 @@
-from sentence_transformers import SentenceTransformer
 import faiss
+import numpy as np
+import argparse
 import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import index_store  # noqa: E402
+from dedup import (  # noqa: E402
+    DEDUP_THRESHOLD,
+    clusters_as_json,
+    collapse_duplicates,
+    find_duplicate_clusters,
+    report_clusters,
+)
+from kb_schema import validate_files  # noqa: E402
+
 # ---------------- CONFIG ----------------
 DATA_DIR = Path("./Data")
-INDEX_PATH = DATA_DIR / "embeddings.faiss"
-META_PATH = DATA_DIR / "meta.json"
 
 MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Parallelism / encoding controls (overridable from the command line)
+LOAD_WORKERS = os.cpu_count() or 1     # processes parsing JSON files
+ENCODE_BATCH_SIZE = 64                 # sentences per forward pass
+ENCODE_THREADS = None                  # torch/faiss threads (None = default)
+ENCODE_PROCESSES = 0                   # >1 starts a multi-process encode pool
+
+# Per-file validation results, reused while a file is unchanged. Kept in
+# the index store, which no knowledge-file scan reads.
+VALIDATION_CACHE = index_store.INDEX_ROOT / "validation_cache.json"
+
+# Related-entries graph ("See also" buttons in the bot)
+RELATED_K = 3                          # neighbours stored per entry (0 = off)
+RELATED_MIN_SCORE = 0.45               # weaker neighbours are not worth offering
 # ----------------------------------------
 
-model = SentenceTransformer(MODEL_NAME)
 
+def _load_json_file(file: Path, base_dir: Path):
+    """
+    Parse and validate one knowledge JSON file.
+    Runs in a worker process, so it must stay importable and side-effect free.
+    """
+    try:
+        data = json.loads(file.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"❌ Invalid JSON in {file}") from e
+
+    if not isinstance(data, list):
+        raise ValueError(f"❌ {file} does not contain a JSON list")
+
+    for idx, item in enumerate(data):
+        if "question" not in item or "answer" not in item:
+            raise ValueError(
+                f"❌ Invalid entry in {file} at index {idx} "
+                "(missing question/answer)"
+            )
+
+        # Optional: embed file trace for debugging (non-breaking)
+        item["_source_file"] = str(file.relative_to(base_dir))
 
-def load_all_json_files(base_dir: Path):
+    return data
+
+
+def find_json_files(base_dir: Path, source_dir: Path = None):
     """
-    Recursively load and merge all JSON files under base_dir,
-    excluding generated files.
+    Knowledge JSON files under source_dir (default: base_dir) in sorted
+    path order, excluding generated files.
     """
-    all_items = []
+    files = []
 
-    for file in sorted(base_dir.rglob("*.json")):
+    for file in sorted((source_dir or base_dir).rglob("*.json")):
         # Skip generated/meta files
         if file.name in {"meta.json", "kb.json"}:
             continue
@@ -30,27 +83,67 @@ def load_all_json_files(base_dir: Path):
         if file.name.startswith("."):
             continue
 
-        print(f"Loading: {file.relative_to(base_dir)}")
+        # Skip published index versions (Data/index/...)
+        if index_store.is_index_path(file):
+            continue
 
-        try:
-            data = json.loads(file.read_text(encoding="utf-8"))
-        except json.JSONDecodeError as e:
-            raise RuntimeError(f"❌ Invalid JSON in {file}") from e
+        files.append(file)
 
-        if not isinstance(data, list):
-            raise ValueError(f"❌ {file} does not contain a JSON list")
+    return files
 
-        for idx, item in enumerate(data):
-            if "question" not in item or "answer" not in item:
-                raise ValueError(
-                    f"❌ Invalid entry in {file} at index {idx} "
-                    "(missing question/answer)"
-                )
 
-            # Optional: embed file trace for debugging (non-breaking)
-            item["_source_file"] = str(file.relative_to(base_dir))
+def validate_json_files(files, base_dir: Path):
+    """
+    Check every file against the entry format before anything expensive
+    runs; exit with all problems listed if any file is invalid.
+    """
+    started = time.perf_counter()
+    errors, warnings, checked = validate_files(files, base_dir, VALIDATION_CACHE)
+    elapsed_ms = 1000 * (time.perf_counter() - started)
 
-            all_items.append(item)
+    for warning in warnings:
+        print(f"⚠️ {warning}")
+
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        raise SystemExit(
+            f"❌ {len(errors)} problem(s) in the knowledge files; nothing was rebuilt"
+        )
+
+    print(
+        f"✅ {len(files)} files valid "
+        f"({checked} re-checked, {elapsed_ms:.0f} ms)"
+    )
+
+
+def load_all_json_files(base_dir: Path, workers: int = LOAD_WORKERS,
+                        source_dir: Path = None, files=None):
+    """
+    Recursively load and merge all JSON files under source_dir
+    (default: base_dir), excluding generated files. Entry source paths
+    stay relative to base_dir either way.
+
+    Files are parsed in parallel but merged in sorted path order,
+    so the index layout is identical to a sequential load.
+    """
+    if files is None:
+        files = find_json_files(base_dir, source_dir)
+
+    for file in files:
+        print(f"Loading: {file.relative_to(base_dir)}")
+
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            parsed = list(pool.map(
+                _load_json_file,
+                files,
+                [base_dir] * len(files),
+            ))
+    else:
+        parsed = [_load_json_file(file, base_dir) for file in files]
+
+    all_items = [item for data in parsed for item in data]
 
     if not all_items:
         raise RuntimeError("❌ No valid knowledge JSON files found!")
@@ -58,15 +151,47 @@ def load_all_json_files(base_dir: Path):
     return all_items
 
 
-def build_faiss_index(texts):
-    embeddings = model.encode(
-        texts,
-        convert_to_numpy=True,
-        show_progress_bar=True
-    )
+def encode_texts(
+    model,
+    texts,
+    batch_size: int = ENCODE_BATCH_SIZE,
+    processes: int = ENCODE_PROCESSES
+):
+    """
+    Encode texts into a float32 matrix (rows in input order).
+
+    Texts are sorted by length first so every batch (and every chunk
+    handed to a pool worker) holds similarly sized inputs, which keeps
+    padding waste low. Rows are put back in input order afterwards.
+    """
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+
+    if processes > 1:
+        pool = model.start_multi_process_pool(["cpu"] * processes)
+        try:
+            encoded = model.encode_multi_process(
+                sorted_texts,
+                pool,
+                batch_size=batch_size,
+            )
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        encoded = model.encode(
+            sorted_texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=True
+        )
+
+    embeddings = np.empty_like(encoded, dtype=np.float32)
+    embeddings[order] = encoded
+    return embeddings
 
-    faiss.normalize_L2(embeddings)
 
+def build_faiss_index(embeddings):
+    """Build an inner-product index over L2-normalized embeddings."""
     dim = embeddings.shape[1]
     index = faiss.IndexFlatIP(dim)
     index.add(embeddings)
@@ -74,11 +199,125 @@ def build_faiss_index(texts):
     return index
 
 
+def build_related_graph(index, embeddings, k: int, min_score: float,
+                        max_score: float = 1.0):
+    """
+    k-nearest-neighbour graph over all entries, from one batched search
+    of the index against itself.
+
+    Returns an int32 (n, k) matrix of neighbour rows, best first, padded
+    with -1. The entry itself, neighbours below min_score and near-duplicates
+    (at or above max_score) are left out.
+    """
+    n = len(embeddings)
+    # Extra candidates make up for self and filtered neighbours
+    scores, neighbours = index.search(embeddings, min(n, 2 * k + 1))
+
+    rows = np.arange(n)[:, None]
+    usable = (
+        (neighbours >= 0)
+        & (neighbours != rows)
+        & (scores >= min_score)
+        & (scores < max_score)
+    )
+
+    # Stable sort moves usable columns first, keeping their score order
+    order = np.argsort(~usable, axis=1, kind="stable")[:, :k]
+    related = np.take_along_axis(neighbours, order, axis=1)
+    related[~np.take_along_axis(usable, order, axis=1)] = -1
+
+    if related.shape[1] < k:
+        related = np.pad(related, ((0, 0), (0, k - related.shape[1])),
+                         constant_values=-1)
+
+    return related.astype(np.int32)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build the FAISS index and metadata from Data/"
+    )
+    parser.add_argument("--kb", default=None,
+                        help="publish into this named knowledge base "
+                             "(default: the main one)")
+    parser.add_argument("--source", type=Path, default=None,
+                        help="only load JSON files under this directory "
+                             "(default: all of Data/)")
+    parser.add_argument("--load-workers", type=int, default=LOAD_WORKERS,
+                        help="processes used to parse JSON files")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE,
+                        help="sentences per encoding batch")
+    parser.add_argument("--threads", type=int, default=ENCODE_THREADS,
+                        help="torch/faiss threads for encoding")
+    parser.add_argument("--processes", type=int, default=ENCODE_PROCESSES,
+                        help="encode with a pool of N processes (N > 1)")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="cosine similarity at which entries count as duplicates")
+    parser.add_argument("--collapse-duplicates", action="store_true",
+                        help="serve one entry per near-duplicate cluster")
+    parser.add_argument("--related-k", type=int, default=RELATED_K,
+                        help="related entries stored per entry (0 disables)")
+    parser.add_argument("--related-min-score", type=float, default=RELATED_MIN_SCORE,
+                        help="minimum similarity of a related entry")
+    parser.add_argument("--keep", type=int, default=index_store.KEEP_VERSIONS,
+                        help="number of index versions to keep")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="VERSION",
+                        help="make VERSION (default: previous) live and exit")
+    parser.add_argument("--list", action="store_true",
+                        help="list published index versions and exit")
+    parser.add_argument("--check", action="store_true",
+                        help="validate the knowledge files and exit")
+    return parser.parse_args()
+
+
+def list_versions(root: Path):
+    live = index_store.current_version(root)
+    for version in index_store.list_versions(root):
+        manifest = index_store.load_manifest(version, root)
+        marker = "*" if version == live else " "
+        print(
+            f"{marker} {version}  entries={manifest.get('entries')}  "
+            f"model={manifest.get('model')}  created={manifest.get('created_at')}"
+        )
+
+
 def main():
+    args = parse_args()
+    root = index_store.kb_root(args.kb)
+
+    if args.list:
+        list_versions(root)
+        return
+
+    if args.rollback is not None:
+        version = index_store.rollback(args.rollback or None, root)
+        print(f"⏪ Live index is now: {version}")
+        return
+
     DATA_DIR.mkdir(exist_ok=True)
 
+    if args.source:
+        if not args.source.resolve().is_relative_to(DATA_DIR.resolve()):
+            raise SystemExit(f"❌ --source must be a directory inside {DATA_DIR}")
+        # Keep entry source paths relative to Data/ (module_of() relies on it)
+        args.source = DATA_DIR / args.source.resolve().relative_to(DATA_DIR.resolve())
+
+    # Before importing torch or loading the model: bad files fail fast
     print("🔍 Scanning knowledge base directories...")
-    kb = load_all_json_files(DATA_DIR)
+    files = find_json_files(DATA_DIR, args.source)
+    validate_json_files(files, DATA_DIR)
+    if args.check:
+        return
+
+    if args.threads:
+        import torch
+
+        torch.set_num_threads(args.threads)
+        faiss.omp_set_num_threads(args.threads)
+
+    load_started = time.perf_counter()
+    kb = load_all_json_files(DATA_DIR, args.load_workers, files=files)
+    load_seconds = time.perf_counter() - load_started
 
     print(f"📚 Total knowledge entries loaded: {len(kb)}")
 
@@ -88,15 +327,117 @@ def main():
     ]
 
     print("🧠 Generating embeddings & building FAISS index...")
-    index = build_faiss_index(texts)
+    # Imported here so JSON load workers don't pay for importing torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(MODEL_NAME)
+    encode_started = time.perf_counter()
+    embeddings = encode_texts(model, texts, args.batch_size, args.processes)
+    faiss.normalize_L2(embeddings)
+    encode_seconds = time.perf_counter() - encode_started
+
+    # Question-only embeddings used by the bot's concept check
+    concept_started = time.perf_counter()
+    concepts = encode_texts(
+        model,
+        [item["question"] for item in kb],
+        args.batch_size,
+        args.processes,
+    )
+    faiss.normalize_L2(concepts)
+    concept_seconds = time.perf_counter() - concept_started
+
+    print("🔎 Checking for near-duplicate entries...")
+    dedup_started = time.perf_counter()
+    clusters = find_duplicate_clusters(embeddings, args.dedup_threshold)
+    report_clusters(kb, clusters)
 
-    print("💾 Saving index and metadata...")
-    faiss.write_index(index, str(INDEX_PATH))
-    META_PATH.write_text(json.dumps(kb, indent=2), encoding="utf-8")
+    if args.collapse_duplicates and clusters:
+        keep = collapse_duplicates(kb, clusters)
+        print(f"🧹 Collapsed {len(kb) - len(keep)} duplicates from the served index")
+    else:
+        keep = list(range(len(kb)))
+
+    duplicates = clusters_as_json(kb, clusters)
+    kb = [kb[i] for i in keep]
+    embeddings = embeddings[keep]
+    concepts = concepts[keep]
+    dedup_seconds = time.perf_counter() - dedup_started
+
+    index = build_faiss_index(embeddings)
+
+    related = None
+    related_seconds = 0.0
+    if args.related_k > 0:
+        print("🕸  Building related-entries graph...")
+        related_started = time.perf_counter()
+        related = build_related_graph(
+            index,
+            embeddings,
+            args.related_k,
+            args.related_min_score,
+            max_score=args.dedup_threshold,
+        )
+        related_seconds = time.perf_counter() - related_started
+        linked = int((related[:, 0] >= 0).sum())
+        print(f"🕸  {linked}/{len(kb)} entries have related entries")
+
+    print("💾 Publishing index version...")
+
+    def write_artifacts(version_dir: Path):
+        faiss.write_index(index, str(version_dir / index_store.INDEX_FILE))
+        (version_dir / index_store.META_FILE).write_text(
+            json.dumps(kb, indent=2), encoding="utf-8"
+        )
+        np.save(version_dir / index_store.CONCEPTS_FILE, concepts)
+        (version_dir / index_store.DUPLICATES_FILE).write_text(
+            json.dumps(duplicates, indent=2), encoding="utf-8"
+        )
+        if related is not None:
+            np.save(version_dir / index_store.RELATED_FILE, related)
+
+    manifest = index_store.publish_version(
+        write_artifacts,
+        {
+            "kb": args.kb or index_store.DEFAULT_KB,
+            "source": str(args.source or DATA_DIR),
+            "entries": len(kb),
+            "model": MODEL_NAME,
+            "dim": index.d,
+            "duplicates": {
+                "threshold": args.dedup_threshold,
+                "clusters": len(duplicates),
+                "collapsed": args.collapse_duplicates,
+            },
+            "related": {
+                "k": args.related_k,
+                "min_score": args.related_min_score,
+            },
+            "timings": {
+                "load_s": round(load_seconds, 3),
+                "encode_s": round(encode_seconds, 3),
+                "concepts_s": round(concept_seconds, 3),
+                "dedup_s": round(dedup_seconds, 3),
+                "related_s": round(related_seconds, 3),
+            },
+        },
+        keep=args.keep,
+        root=root,
+    )
 
     print("✅ Training complete!")
-    print(f"📌 Index saved to: {INDEX_PATH}")
-    print(f"📌 Metadata saved to: {META_PATH}")
+    print(f"📌 Live version: {manifest['version']}")
+    print(f"📌 Artifacts in: {manifest['_dir']}")
+    print(
+        f"⏱  Load:   {load_seconds:.2f}s "
+        f"({len(kb) / max(load_seconds, 1e-9):.0f} entries/s, "
+        f"{args.load_workers} workers)"
+    )
+    print(
+        f"⏱  Encode: {encode_seconds:.2f}s "
+        f"({len(kb) / max(encode_seconds, 1e-9):.0f} entries/s, "
+        f"batch {args.batch_size}, {max(args.processes, 1)} process(es))"
+    )
 
 
 if __name__ == "__main__":
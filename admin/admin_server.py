@@ -1,5 +1,9 @@
 import json
+import os
 import uuid
+import hashlib
+import tempfile
+import threading
 import subprocess
 from datetime import datetime
 from pathlib import Path
@@ -27,6 +31,13 @@ KB_PATH = BASE_DIR / "Data" / "kb.json"
 TRAIN_SCRIPT = BASE_DIR / "training" / "train_index.py"
 UPLOAD_DIR = BASE_DIR / "Notes" / "Uploads"
 
+# Content-addressed upload store:
+#   objects/<sha[:2]>/<sha><ext>  one copy per distinct file content
+#   uploads.json                  name -> sha and sha -> object info
+OBJECTS_DIR = UPLOAD_DIR / "objects"
+UPLOAD_INDEX_PATH = UPLOAD_DIR / "uploads.json"
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # ===============================
@@ -76,27 +87,72 @@ def generate_readable_id(kb):
     return f"{today}-{str(count + 1).zfill(3)}"
 
 # ===============================
-# HELPER: SAFE FILE SAVE
+# HELPER: CONTENT-ADDRESSED FILE SAVE
 # ===============================
 
-def save_file_preserve_name(uploaded_file):
-    original_name = secure_filename(uploaded_file.filename)
-    target = UPLOAD_DIR / original_name
+_upload_lock = threading.Lock()
+
+
+def load_upload_index():
+    if UPLOAD_INDEX_PATH.exists() and UPLOAD_INDEX_PATH.stat().st_size > 0:
+        return json.loads(UPLOAD_INDEX_PATH.read_text("utf-8"))
+    return {"names": {}, "objects": {}}
 
-    if not target.exists():
-        uploaded_file.save(target)
-        return target
 
-    # Handle duplicates: file(1).pdf
-    stem = target.stem
-    suffix = target.suffix
-    i = 1
-    while True:
-        new_target = UPLOAD_DIR / f"{stem}({i}){suffix}"
-        if not new_target.exists():
-            uploaded_file.save(new_target)
-            return new_target
-        i += 1
+def save_upload_index(index):
+    tmp = UPLOAD_INDEX_PATH.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(index, indent=2, ensure_ascii=False), "utf-8")
+    os.replace(tmp, UPLOAD_INDEX_PATH)
+
+
+def save_file_content_addressed(uploaded_file):
+    """
+    Stream an upload to disk in chunks while hashing it, then store it
+    under its SHA-256. Identical content is kept once; the original name
+    is recorded in uploads.json. Returns (stored_path, original_name).
+    """
+    original_name = secure_filename(uploaded_file.filename)
+    suffix = Path(original_name).suffix.lower()
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = uploaded_file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+        sha = digest.hexdigest()
+        target = OBJECTS_DIR / sha[:2] / f"{sha}{suffix}"
+
+        with _upload_lock:
+            if target.exists():
+                os.remove(tmp_name)          # duplicate content: keep one copy
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_name, target)
+
+            index = load_upload_index()
+            index["names"][original_name] = sha
+            obj = index["objects"].setdefault(sha, {
+                "path": str(target.relative_to(BASE_DIR)),
+                "size": size,
+                "names": [],
+            })
+            if original_name not in obj["names"]:
+                obj["names"].append(original_name)
+            save_upload_index(index)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+    return target, original_name
 
 # ===============================
 # REBUILD INDEX
@@ -147,12 +203,13 @@ def save_entry():
     uploaded_file = request.files.get("file")
     source = None
     if uploaded_file:
-        saved_path = save_file_preserve_name(uploaded_file)
+        saved_path, original_name = save_file_content_addressed(uploaded_file)
         source = {
             "type": "file",
             "path": {
                 saved_path.suffix: str(saved_path.relative_to(BASE_DIR))
-            }
+            },
+            "name": original_name
         }
 
     entry = {
@@ -220,7 +277,10 @@ def serve_file_by_entry_id(entry_id):
     if not file_path.exists():
         abort(404)
 
-    return send_file(file_path)
+    return send_file(
+        file_path,
+        download_name=entry["source"].get("name") or file_path.name
+    )
 
 # ===============================
 if __name__ == "__main__":
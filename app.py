@@ -1,14 +1,36 @@
+import argparse
+import csv
+import io
 import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
 from pathlib import Path
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify
 from admin_access import touch_activity
+from index_store import is_index_path
+
+# Same entry rules the trainer enforces (Training/kb_schema.py)
+sys.path.insert(0, str(Path(__file__).parent / "Training"))
+from kb_schema import entry_errors  # noqa: E402
 
 BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / Path("Data")
 
 ADMIN_PATH = BASE_DIR / Path("admin_identity.json")
 
+TRAIN_SCRIPT = BASE_DIR / "Training" / "train_index.py"
+
+IMPORT_FORMATS = {"csv", "json", "ndjson"}
+IMPORT_REQUIRED = ("semester", "subject", "module", "question", "answer")
+IMPORT_OPTIONAL_TEXT = ("source_type", "notes")
+
+# Mode of newly written data files (mkstemp would leave them 0600)
+NEW_FILE_MODE = 0o644
+
 app = Flask(
     __name__,
     template_folder="admin/templates",
@@ -36,14 +58,14 @@ def sem_to_roman(sem: int) -> str:
         raise ValueError("Unsupported semester")
     return ROMAN[sem]
 
-def resolve_json_file(semester, subject, module):
+def module_json_path(semester, subject, module) -> Path:
     roman = sem_to_roman(semester)
+    return DATA_DIR / f"Sem-{roman}" / subject / f"Sem-{roman}_{subject}_Mod-{module}.json"
 
-    sem_dir = DATA_DIR / f"Sem-{roman}"
-    subject_dir = sem_dir / subject
-    subject_dir.mkdir(parents=True, exist_ok=True)
 
-    file_path = subject_dir / f"Sem-{roman}_{subject}_Mod-{module}.json"
+def resolve_json_file(semester, subject, module):
+    file_path = module_json_path(semester, subject, module)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
 
     if not file_path.exists():
         file_path.write_text("[]")
@@ -51,9 +73,8 @@ def resolve_json_file(semester, subject, module):
     return file_path
 
 
-def resolve_subject(subject_input: str) -> str:
-    subjects = load_subjects()
-
+def match_subject(subjects: dict, subject_input: str) -> str:
+    """Subject code for an acronym or full name; registers new subjects in `subjects`."""
     normalized = subject_input.strip().lower()
 
     # Match by acronym
@@ -69,11 +90,20 @@ def resolve_subject(subject_input: str) -> str:
     # New subject → register
     new_code = subject_input.strip().upper().replace(" ", "_")
     subjects[new_code] = subject_input.strip()
-    save_subjects(subjects)
-
     return new_code
 
 
+def resolve_subject(subject_input: str) -> str:
+    subjects = load_subjects()
+    known = len(subjects)
+
+    code = match_subject(subjects, subject_input)
+    if len(subjects) != known:
+        save_subjects(subjects)
+
+    return code
+
+
 def next_serial(entries):
     if not entries:
         return 1
@@ -92,6 +122,30 @@ def generate_id(semester, subject, module, serial):
     return f"S{semester}_{subject}_M{module}_{serial:03d}"
 
 
+def write_json_atomic(path: Path, data):
+    try:
+        mode = stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def rebuild_index():
+    """Publish a new index version in the background (train_index.py)."""
+    return subprocess.Popen([sys.executable, str(TRAIN_SCRIPT)], cwd=BASE_DIR)
+
+
 def parse_id(entry_id):
     # S3_AME_I_M1_001
     parts = entry_id.split("_")
@@ -100,6 +154,213 @@ def parse_id(entry_id):
     module = int(parts[2][1:])
     return semester, subject, module
 
+# ------------------------
+# Bulk import
+# ------------------------
+
+def parse_batch(text: str, fmt: str):
+    """Rows of a CSV (with header), JSON list or NDJSON batch."""
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(text)))
+    if fmt == "json":
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("JSON batch must be a list of entries")
+        return rows
+    if fmt == "ndjson":
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def batch_format(filename: str = None, content_type: str = None) -> str:
+    suffix = Path(filename or "").suffix.lstrip(".").lower()
+    if suffix in {"jsonl", "ndjson"}:
+        return "ndjson"
+    if suffix in IMPORT_FORMATS:
+        return suffix
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return "json"
+
+
+def as_int(value):
+    """int of an integer or a numeric string; None for anything else."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def row_problems(row):
+    """Type problems of one import row (required fields are present)."""
+    problems = []
+
+    semester = as_int(row["semester"])
+    if semester is None or semester not in ROMAN:
+        problems.append(f"invalid semester {row['semester']!r}")
+    if as_int(row["module"]) is None:
+        problems.append(f"invalid module {row['module']!r}")
+
+    for field in ("subject", "question", "answer"):
+        if not isinstance(row[field], str):
+            problems.append(f"{field} must be a string")
+
+    tags = row.get("tags")
+    if not (
+        tags is None
+        or isinstance(tags, str)
+        or (isinstance(tags, list) and all(isinstance(t, str) for t in tags))
+    ):
+        problems.append("tags must be a string or a list of strings")
+
+    for field in IMPORT_OPTIONAL_TEXT:
+        if not isinstance(row.get(field) or "", str):
+            problems.append(f"{field} must be a string")
+
+    return problems
+
+
+def build_entry(row, entry_id: str, created_at: str) -> dict:
+    """KB entry for a validated import row."""
+    return {
+        "id": entry_id,
+        "question": row["question"],
+        "answer": row["answer"],
+        "tags": row["tags"],
+        "source": {
+            "type": row["source_type"],
+            "path": row["source_path"],
+            "url": row["source_url"],
+        },
+        "created_at": created_at,
+        "notes": row["notes"],
+    }
+
+
+def validate_rows(rows):
+    """
+    Check every row (not just up to the first error).
+    Returns (clean rows, ["row N: problem", ...]).
+    """
+    clean, errors = [], []
+
+    for n, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append(f"row {n}: not an object")
+            continue
+
+        missing = [f for f in IMPORT_REQUIRED if not str(row.get(f) or "").strip()]
+        if missing:
+            errors.append(f"row {n}: missing {', '.join(missing)}")
+            continue
+
+        problems = row_problems(row)
+        if problems:
+            errors += [f"row {n}: {problem}" for problem in problems]
+            continue
+
+        tags = row.get("tags") or []
+        if isinstance(tags, str):
+            tags = tags.split(",")
+        tags = [t.strip() for t in tags if t.strip()]
+
+        row = {
+            "semester": as_int(row["semester"]),
+            "subject": row["subject"].strip(),
+            "module": as_int(row["module"]),
+            "question": row["question"].strip(),
+            "answer": row["answer"].strip(),
+            "tags": tags,
+            "source_type": row.get("source_type") or "file",
+            "source_path": row.get("source_path") or None,
+            "source_url": row.get("source_url") or None,
+            "notes": row.get("notes") or None,
+        }
+
+        # The entry as it will be written must pass the trainer's check,
+        # or the rebuild this import starts would reject its file
+        problems = entry_errors(build_entry(row, "pending", ""))
+        if problems:
+            errors += [f"row {n}: {problem}" for problem in problems]
+            continue
+
+        clean.append(row)
+
+    return clean, errors
+
+
+def import_entries(rows, dry_run: bool = False) -> dict:
+    """
+    Validate a batch, group it by module file, append new entries with
+    serial ids, and write each affected file once (atomically).
+    Questions already present in their module file are skipped.
+    Nothing is written if any row is invalid.
+    """
+    clean, errors = validate_rows(rows)
+    if errors:
+        return {"created": 0, "skipped": 0, "files": [], "errors": errors}
+
+    # subjects.json is read once and written at most once
+    subjects = load_subjects()
+    known = len(subjects)
+    codes = {}
+
+    groups = {}
+    for row in clean:
+        subject = codes.get(row["subject"])
+        if subject is None:
+            subject = codes[row["subject"]] = match_subject(subjects, row["subject"])
+        groups.setdefault((row["semester"], subject, row["module"]), []).append(row)
+
+    if len(subjects) != known and not dry_run:
+        save_subjects(subjects)
+
+    created = skipped = 0
+    files = []
+    now = datetime.now().isoformat()
+
+    for (semester, subject, module), group in groups.items():
+        file_path = module_json_path(semester, subject, module)
+        entries = json.loads(file_path.read_text()) if file_path.exists() else []
+
+        existing = {e.get("question", "").strip().lower() for e in entries}
+        serial = next_serial(entries)
+        added = 0
+
+        for row in group:
+            key = row["question"].lower()
+            if key in existing:
+                skipped += 1
+                continue
+            existing.add(key)
+
+            entries.append(
+                build_entry(row, generate_id(semester, subject, module, serial), now)
+            )
+            serial += 1
+            added += 1
+
+        if added:
+            if not dry_run:
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                write_json_atomic(file_path, entries)
+            files.append(str(file_path.relative_to(BASE_DIR)))
+            created += added
+
+    return {"created": created, "skipped": skipped, "files": files, "errors": []}
+
+
 # ------------------------
 # Pages
 # ------------------------
@@ -141,6 +402,12 @@ def api_data():
     all_entries = []
 
     for json_file in DATA_DIR.rglob("*.json"):
+        # Generated index versions are copies of the module files
+        if is_index_path(json_file):
+            continue
+        # Hidden files are caches, not knowledge files (as in train_index.py)
+        if json_file.name.startswith("."):
+            continue
         try:
             all_entries.extend(json.loads(json_file.read_text()))
         except Exception:
@@ -182,6 +449,40 @@ def create_entry():
 
     return jsonify(entry), 201
 
+@app.route("/api/import", methods=["POST"])
+def bulk_import():
+    """
+    Import a CSV / JSON / NDJSON batch, sent as an uploaded "file" or as
+    the request body. ?dry_run=1 validates only; ?reindex=0 skips the
+    index rebuild.
+    """
+    upload = request.files.get("file")
+    if upload:
+        text = upload.read().decode("utf-8-sig")
+        fmt = batch_format(upload.filename, upload.content_type)
+    else:
+        text = request.get_data(as_text=True)
+        fmt = batch_format(content_type=request.content_type)
+    fmt = request.args.get("format", fmt)
+
+    try:
+        rows = parse_batch(text, fmt)
+    except (ValueError, csv.Error) as e:
+        return jsonify({"errors": [f"could not parse {fmt} batch: {e}"]}), 400
+
+    dry_run = request.args.get("dry_run") == "1"
+    result = import_entries(rows, dry_run=dry_run)
+    if result["errors"]:
+        return jsonify(result), 400
+
+    result["reindexing"] = bool(
+        result["created"] and not dry_run and request.args.get("reindex", "1") != "0"
+    )
+    if result["reindexing"]:
+        rebuild_index()
+
+    return jsonify(result), 201 if result["created"] and not dry_run else 200
+
 @app.route("/edit/<entry_id>")
 def edit_entry_page(entry_id):
     admin = json.loads(ADMIN_PATH.read_text())
@@ -241,5 +542,41 @@ def delete_entry(entry_id):
 
 # ------------------------
 
+def import_cli(argv):
+    parser = argparse.ArgumentParser(
+        prog="app.py import",
+        description="Bulk import KB entries from CSV / JSON / NDJSON"
+    )
+    parser.add_argument("batch", type=Path)
+    parser.add_argument("--format", choices=sorted(IMPORT_FORMATS))
+    parser.add_argument("--dry-run", action="store_true",
+                        help="validate and report without writing")
+    parser.add_argument("--no-reindex", action="store_true",
+                        help="do not rebuild the index afterwards")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or batch_format(args.batch.name)
+    rows = parse_batch(args.batch.read_text(encoding="utf-8-sig"), fmt)
+    result = import_entries(rows, dry_run=args.dry_run)
+
+    if result["errors"]:
+        print(f"❌ {len(result['errors'])} invalid rows, nothing imported:")
+        for error in result["errors"]:
+            print(f"   {error}")
+        sys.exit(1)
+
+    verb = "Would import" if args.dry_run else "Imported"
+    print(f"✅ {verb} {result['created']} entries ({result['skipped']} already present)")
+    for file in result["files"]:
+        print(f"   {file}")
+
+    if result["created"] and not (args.dry_run or args.no_reindex):
+        print("🧠 Rebuilding index...")
+        sys.exit(rebuild_index().wait())
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    if sys.argv[1:2] == ["import"]:
+        import_cli(sys.argv[2:])
+    else:
+        app.run(debug=True)
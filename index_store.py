@@ -0,0 +1,316 @@
+"""
+Versioned, atomically published index artifacts.
+
+Every training run writes into its own directory under Data/index/:
+
+    Data/index/
+    ├── CURRENT                  # name of the live version (one line)
+    ├── 20260105-130000-000007-1a2b3c4d/
+    │   ├── embeddings.faiss
+    │   ├── meta.json
+    │   ├── concepts.npy         # normalized question embeddings
+    │   ├── duplicates.json      # near-duplicate report (optional)
+    │   ├── related.npy          # k-nearest-neighbour rows per entry (optional)
+    │   └── manifest.json
+    └── ...
+
+A version directory is fully written before it is renamed into place,
+and CURRENT is swapped with os.replace(), so a reader (bot, fetcher)
+always sees a complete index + metadata pair from the same run.
+
+Older versions are kept (KEEP_VERSIONS) for instant rollback.
+
+Versions are ordered by the "sequence" number in their manifest (one more
+than the highest published so far), not by name or clock, so versions
+published within the same second or across a clock change still list,
+prune and roll back in publish order. Names carry the UTC time and the
+sequence for readability.
+
+Additional named knowledge bases (e.g. one per course or batch) use the
+same layout under Data/index/kbs/<name>/. Every reader/writer takes an
+optional `root` (see kb_root()); the default is the main KB above.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "Data"
+INDEX_ROOT = DATA_DIR / "index"
+POINTER_NAME = "CURRENT"
+POINTER_PATH = INDEX_ROOT / POINTER_NAME
+KBS_ROOT = INDEX_ROOT / "kbs"
+
+DEFAULT_KB = "default"
+
+INDEX_FILE = "embeddings.faiss"
+META_FILE = "meta.json"
+CONCEPTS_FILE = "concepts.npy"
+DUPLICATES_FILE = "duplicates.json"
+RELATED_FILE = "related.npy"
+MANIFEST_FILE = "manifest.json"
+
+# Pre-versioning layout (read-only fallback)
+LEGACY_INDEX_PATH = DATA_DIR / INDEX_FILE
+LEGACY_META_PATH = DATA_DIR / META_FILE
+
+KEEP_VERSIONS = 5
+
+
+# =========================================================
+# Helpers
+# =========================================================
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync_dir(path: Path):
+    # Directory fsync is not available on every platform (e.g. Windows)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_pointer(version: str, root: Path = INDEX_ROOT):
+    pointer = root / POINTER_NAME
+    tmp = pointer.with_name(pointer.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+    _fsync_dir(root)
+
+
+def is_index_path(path: Path) -> bool:
+    """True if path lives inside the generated index store."""
+    try:
+        path.resolve().relative_to(INDEX_ROOT.resolve())
+        return True
+    except ValueError:
+        return False
+
+
+def kb_root(name: str = None) -> Path:
+    """Index directory of a named knowledge base (None = the main KB)."""
+    if not name or name == DEFAULT_KB:
+        return INDEX_ROOT
+    if not name.replace("-", "").replace("_", "").isalnum():
+        raise ValueError(f"Invalid knowledge base name: {name!r}")
+    return KBS_ROOT / name
+
+
+def list_kbs():
+    """Names of knowledge bases with a published (or legacy) index."""
+    names = []
+    if (INDEX_ROOT / POINTER_NAME).exists() or LEGACY_INDEX_PATH.exists():
+        names.append(DEFAULT_KB)
+    if KBS_ROOT.exists():
+        names.extend(sorted(
+            p.name for p in KBS_ROOT.iterdir()
+            if (p / POINTER_NAME).exists()
+        ))
+    return names
+
+
+# =========================================================
+# Readers
+# =========================================================
+
+def current_version(root: Path = INDEX_ROOT):
+    """Return the live version name, or None if nothing is published."""
+    try:
+        return (root / POINTER_NAME).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(root: Path = INDEX_ROOT):
+    """Published versions, oldest first (in publish order)."""
+    if not root.exists():
+        return []
+    return [name for _, _, name in sorted(
+        _publish_key(p) for p in root.iterdir()
+        if p.is_dir() and (p / MANIFEST_FILE).exists()
+    )]
+
+
+def _publish_key(version_dir: Path):
+    """
+    (sequence, created_at, name) of a version. Versions published before
+    sequence numbers were recorded count as 0 and keep their own order.
+    """
+    try:
+        manifest = json.loads((version_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        manifest = {}
+    return manifest.get("sequence", 0), manifest.get("created_at", ""), version_dir.name
+
+
+def next_sequence(root: Path = INDEX_ROOT) -> int:
+    """Sequence number for the next published version."""
+    versions = root.iterdir() if root.exists() else ()
+    return 1 + max(
+        (_publish_key(p)[0] for p in versions
+         if p.is_dir() and (p / MANIFEST_FILE).exists()),
+        default=0,
+    )
+
+
+def load_manifest(version: str = None, root: Path = INDEX_ROOT) -> dict:
+    """
+    Load the manifest of a version (default: the live one).
+
+    The returned dict gains "_dir" and absolute "_paths" for each artifact.
+    Falls back to the legacy Data/embeddings.faiss + Data/meta.json pair
+    when no versioned index has been published yet (main KB only).
+    """
+    version = version or current_version(root)
+
+    if version is None:
+        if root != INDEX_ROOT or not LEGACY_INDEX_PATH.exists():
+            raise FileNotFoundError(
+                "No index published. Run Training/train_index.py first."
+            )
+        return {
+            "version": None,
+            "_dir": DATA_DIR,
+            "_paths": {
+                "index": LEGACY_INDEX_PATH,
+                "meta": LEGACY_META_PATH,
+                "concepts": None,
+                "related": None,
+            },
+        }
+
+    version_dir = root / version
+    manifest = json.loads(
+        (version_dir / MANIFEST_FILE).read_text(encoding="utf-8")
+    )
+    manifest["_dir"] = version_dir
+    manifest["_paths"] = {
+        name: (version_dir / filename) if filename else None
+        for name, filename in manifest["files"].items()
+    }
+    return manifest
+
+
+# =========================================================
+# Writer
+# =========================================================
+
+def publish_version(write_artifacts, info: dict, keep: int = KEEP_VERSIONS,
+                    root: Path = INDEX_ROOT) -> dict:
+    """
+    Write a new version and make it live atomically.
+
+    write_artifacts(tmp_dir) must create INDEX_FILE and META_FILE inside
+    tmp_dir, and may add CONCEPTS_FILE / DUPLICATES_FILE / RELATED_FILE.
+    info is merged into the manifest (entry count, model, dim, timings, ...).
+    """
+    root.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    stamp = now.strftime("%Y%m%d-%H%M%S")
+    tmp_dir = root / f".tmp-{stamp}-{os.getpid()}"
+    tmp_dir.mkdir()
+
+    try:
+        write_artifacts(tmp_dir)
+
+        files = {"index": INDEX_FILE, "meta": META_FILE}
+        for name, filename in (
+            ("concepts", CONCEPTS_FILE),
+            ("duplicates", DUPLICATES_FILE),
+            ("related", RELATED_FILE),
+        ):
+            if (tmp_dir / filename).exists():
+                files[name] = filename
+
+        content_hash = file_sha256(tmp_dir / META_FILE)
+        sequence = next_sequence(root)
+        version = f"{stamp}-{sequence:06d}-{content_hash[:8]}"
+
+        manifest = {
+            "version": version,
+            "sequence": sequence,
+            "created_at": now.isoformat(),
+            "content_hash": content_hash,
+            "index_sha256": file_sha256(tmp_dir / INDEX_FILE),
+            "files": files,
+            **info,
+        }
+        manifest.setdefault("timings", {})
+        manifest["timings"]["publish_s"] = round(time.perf_counter() - started, 3)
+
+        (tmp_dir / MANIFEST_FILE).write_text(
+            json.dumps(manifest, indent=2), encoding="utf-8"
+        )
+        for path in tmp_dir.iterdir():
+            with path.open("r+b") as f:
+                os.fsync(f.fileno())
+
+        final_dir = root / version
+        if final_dir.exists():
+            # A concurrent run published the same content as the same version
+            shutil.rmtree(tmp_dir)
+        else:
+            os.replace(tmp_dir, final_dir)
+            _fsync_dir(root)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _write_pointer(version, root)
+    prune_versions(keep, root)
+    return load_manifest(version, root)
+
+
+def prune_versions(keep: int = KEEP_VERSIONS, root: Path = INDEX_ROOT):
+    """Delete all but the newest `keep` versions (never the live one)."""
+    live = current_version(root)
+    versions = list_versions(root)
+
+    for version in versions[:max(len(versions) - keep, 0)]:
+        if version != live:
+            shutil.rmtree(root / version, ignore_errors=True)
+
+
+def rollback(version: str = None, root: Path = INDEX_ROOT) -> str:
+    """
+    Point CURRENT at `version`, or at the version published just before
+    the live one. Returns the new live version.
+    """
+    versions = list_versions(root)
+    if not versions:
+        raise RuntimeError("No published index versions to roll back to")
+
+    if version is None:
+        live = current_version(root)
+        older = versions[:versions.index(live)] if live in versions else versions
+        if not older:
+            raise RuntimeError(f"No version older than {live}")
+        version = older[-1]
+    elif version not in versions:
+        raise ValueError(f"Unknown index version: {version}")
+
+    _write_pointer(version, root)
+    return version
@@ -0,0 +1,238 @@
+"""
+Shared helpers for KB source files (Notes/).
+
+- source_paths() / resolve_source(): map a KB "source.path" value to
+  files inside Notes/
+- file_digest(): SHA-256 of a file, cached by (path, size, mtime)
+- module bundles: one ZIP per semester/subject/module, streamed to disk
+  file by file and cached under Data/bundles/ keyed by the content hashes
+  of the files it contains.
+"""
+
+import hashlib
+import os
+import threading
+import zipfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+NOTES_DIR = BASE_DIR / "Notes"
+BUNDLE_DIR = BASE_DIR / "Data" / "bundles"
+
+MAX_CACHED_BUNDLES = 20
+
+# Already-compressed formats are stored as-is instead of deflated again
+STORED_SUFFIXES = {".pdf", ".docx", ".pptx", ".xlsx", ".zip", ".png", ".jpg", ".jpeg"}
+
+ROMAN = {
+    1: "I", 2: "II", 3: "III", 4: "IV",
+    5: "V", 6: "VI", 7: "VII", 8: "VIII"
+}
+
+_digest_cache = {}
+_bundle_lock = threading.Lock()
+
+
+# =========================================================
+# Source files
+# =========================================================
+
+def resolve_source(rel_path: str):
+    """
+    Resolve a KB source path inside NOTES_DIR (None if it escapes it).
+    Accepts both "/Linux/x.md" (relative to Notes) and "Notes/Linux/x.md"
+    (relative to the project root, as written by the admin uploader).
+    """
+    notes_root = NOTES_DIR.resolve()
+    rel_path = rel_path.removeprefix("./").lstrip("/")
+    if rel_path.startswith(f"{NOTES_DIR.name}/"):
+        rel_path = rel_path[len(NOTES_DIR.name) + 1:]
+    file_path = (notes_root / rel_path).resolve()
+    try:
+        file_path.relative_to(notes_root)
+    except ValueError:
+        return None
+    return file_path
+
+
+def file_digest(file_path: Path, st: os.stat_result = None) -> str:
+    """SHA-256 of a file, recomputed only when its size or mtime changes."""
+    st = st or file_path.stat()
+    key = (str(file_path), st.st_size, st.st_mtime_ns)
+
+    digest = _digest_cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with file_path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = _digest_cache[key] = sha.hexdigest()
+
+    return digest
+
+
+def source_paths(item) -> dict:
+    """
+    {ext: path} of an entry's source files. The documented format is a
+    mapping; a bare path string (as in most hand-written module files)
+    is keyed by its suffix.
+    """
+    paths = (item.get("source") or {}).get("path") or {}
+    if isinstance(paths, str):
+        ext = Path(paths).suffix.lstrip(".").lower() or "file"
+        return {ext: paths}
+    return paths
+
+
+def item_source_files(item):
+    """Yield (ext, resolved_path) for every existing source file of an entry."""
+    for ext, rel_path in source_paths(item).items():
+        file_path = resolve_source(rel_path)
+        if file_path and file_path.is_file():
+            yield ext, file_path
+
+
+# =========================================================
+# Modules
+# =========================================================
+
+def normalize_semester(value) -> str:
+    """Accept 3, "3", "III" or "Sem-III" and return "III"."""
+    text = str(value).strip().upper().removeprefix("SEM-").removeprefix("SEM")
+    if text.isdigit():
+        return ROMAN[int(text)]
+    return text
+
+
+def normalize_module(value) -> str:
+    """Accept 1, "1", "Mod-1", "M1", "P" or "Practicals"."""
+    text = str(value).strip().upper()
+    if text in {"P", "PRACTICAL", "PRACTICALS"}:
+        return "P"
+    return text.removeprefix("MOD-").removeprefix("M")
+
+
+def module_of(item):
+    """
+    (semester, subject, module) of an entry, taken from the module file it
+    was loaded from, e.g. "Sem-III/DS/Sem-III_DS_Mod-1.json" -> ("III", "DS", "1").
+    """
+    source_file = item.get("_source_file")
+    if not source_file:
+        return None
+
+    parts = Path(source_file).parts
+    if len(parts) < 3 or not parts[0].startswith("Sem-"):
+        return None
+
+    stem = Path(source_file).stem
+    if stem.endswith("Practicals"):
+        module = "P"
+    elif "Mod-" in stem:
+        module = stem.rsplit("Mod-", 1)[1]
+    else:
+        return None
+
+    return parts[0][len("Sem-"):], parts[1], module
+
+
+def module_files(kb, semester, subject, module):
+    """
+    Every distinct source file of a module as [(arcname, path, digest)],
+    sorted by arcname.
+    """
+    wanted = (
+        normalize_semester(semester),
+        subject.strip().upper(),
+        normalize_module(module),
+    )
+
+    files = {}
+    for item in kb:
+        key = module_of(item)
+        if not key or (key[0], key[1].upper(), key[2]) != wanted:
+            continue
+
+        for _, file_path in item_source_files(item):
+            if file_path in files:
+                continue
+            name = (item.get("source") or {}).get("name")
+            arcname = name or file_path.relative_to(NOTES_DIR.resolve()).as_posix()
+            files[file_path] = arcname
+
+    result = []
+    seen = set()
+    for file_path, arcname in sorted(files.items(), key=lambda kv: kv[1]):
+        digest = file_digest(file_path)
+        if arcname in seen:
+            arcname = f"{digest[:8]}_{arcname}"
+        seen.add(arcname)
+        result.append((arcname, file_path, digest))
+
+    return result
+
+
+# =========================================================
+# Bundles
+# =========================================================
+
+def bundle_key(files) -> str:
+    """Cache key: hash of the (arcname, content hash) set of a bundle."""
+    sha = hashlib.sha256()
+    for arcname, _, digest in files:
+        sha.update(f"{arcname}\0{digest}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def build_bundle(files) -> Path:
+    """
+    Return the cached ZIP for `files`, building it if needed.
+
+    Files are copied into the archive one at a time in chunks
+    (ZipFile.write), so memory use does not grow with bundle size.
+    """
+    key = bundle_key(files)
+    target = BUNDLE_DIR / f"{key}.zip"
+
+    with _bundle_lock:
+        if target.exists():
+            os.utime(target)         # mark as recently used
+            return target
+
+        BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(".zip.tmp")
+
+        try:
+            with zipfile.ZipFile(tmp, "w") as zf:
+                for arcname, file_path, _ in files:
+                    compress = (
+                        zipfile.ZIP_STORED
+                        if file_path.suffix.lower() in STORED_SUFFIXES
+                        else zipfile.ZIP_DEFLATED
+                    )
+                    zf.write(file_path, arcname, compress_type=compress)
+            os.replace(tmp, target)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+        prune_bundles()
+
+    return target
+
+
+def prune_bundles(keep: int = MAX_CACHED_BUNDLES):
+    """Drop least recently used bundles beyond `keep`."""
+    bundles = sorted(
+        BUNDLE_DIR.glob("*.zip"),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for path in bundles[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def bundle_name(semester, subject, module) -> str:
+    module = normalize_module(module)
+    label = "Practicals" if module == "P" else f"Mod-{module}"
+    return f"Sem-{normalize_semester(semester)}_{subject.strip().upper()}_{label}.zip"